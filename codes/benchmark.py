@@ -0,0 +1,333 @@
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from classes import MyApi, ReplayTransport, TopicAggregator, PublicationAggregator, WorkParser, WorkDeduplicator, short_ror
+
+
+INSTITUTION_ROR = "https://ror.org/0020snb74"
+COLLABORATOR_ROR = "https://ror.org/02feahw73"
+PARTNERS = [(INSTITUTION_ROR, "CA")] + [(f"https://ror.org/0{i:02d}synth", country)
+                                        for i, country in enumerate(["FR", "US", "DE", "CN", "GB", "IT", "ES", "JP", "BR", "IN"] * 3)]
+PARTNERS[1] = (COLLABORATOR_ROR, "FR")
+TOPICS = [f"Sujet {i}" for i in range(60)]
+# Une publication sur DUPLICATE_EVERY est une autre version (sans DOI, même titre) de la précédente
+DUPLICATE_EVERY = 50
+
+
+def synthetic_work(index, year):
+    """Publication synthétique déterministe, au format des réponses OpenAlex (champs sélectionnés par MyApi)"""
+    rnd = random.Random(year * 1_000_003 + index)
+    duplicate = index % DUPLICATE_EVERY == DUPLICATE_EVERY - 1
+    institutions = [PARTNERS[0]] + rnd.sample(PARTNERS[1:], rnd.randint(0, 4))
+    return {
+        "id": f"https://openalex.org/W{year}{index:07d}",
+        "updated_date": f"{year + 1}-01-01T00:00:00",
+        "display_name": f"Publication synthétique {index - duplicate} ({year})",
+        "publication_year": year,
+        "doi": f"https://doi.org/10.5555/{year}.{index}" if index % 5 and not duplicate else None,
+        "authorships": [
+            {"institutions": [{"id": f"https://openalex.org/I{short_ror(ror)}", "ror": ror, "country_code": country,
+                               "display_name": f"Institution {short_ror(ror)}"}]}
+            for ror, country in institutions
+        ],
+        "topics": [{"id": f"https://openalex.org/T{topic}", "display_name": TOPICS[topic]}
+                   for topic in sorted(set(rnd.choices(range(len(TOPICS)), k=3)))],
+    }
+
+
+class SyntheticTransport(BaseAdapter):
+    """Adaptateur requests servant un corpus synthétique de publications, paginé comme OpenAlex (curseur, 200 par page).
+
+    Les pages sont encodées à la construction : le téléchargement mesuré ne comprend ni génération ni réseau.
+    Seuls les filtres publication_year et authorships.institutions.ror (co-signature) sont interprétés ; les regroupements
+    (group_by) de MyApi.GROUP_BY_FIELDS sont calculés comme par OpenAlex, une fois par publication.
+    """
+
+    def __init__(self, size, start_year, end_year, per_page=200):
+        super().__init__()
+        years = list(range(start_year, end_year + 1))
+        self.per_page = per_page
+        self.works = {year: [synthetic_work(index, year) for index in range(size // len(years) + (i < size % len(years)))]
+                      for i, year in enumerate(years)}
+        self.pages = {}
+
+    def page_bodies(self):
+        """Corps JSON de toutes les pages d'une extraction complète, sans filtre de co-signature"""
+        return [self.__page(year, (), cursor) for year in self.works
+                for cursor in range(0, max(len(self.works[year]), 1), self.per_page)]
+
+    def __works(self, year, rors):
+        works = self.works.get(year, [])
+        if rors:
+            works = [work for work in works if set(rors) <= {short_ror(institution["ror"]) for authorship in work["authorships"]
+                                                              for institution in authorship["institutions"]}]
+        return works
+
+    def __groups(self, years, rors, field):
+        """Page unique d'une requête group_by : nombre de publications par valeur distincte du champ"""
+        counts = Counter()
+        labels = {}
+        for year in years:
+            for work in self.__works(year, rors):
+                if field == "publication_year":
+                    keys = {str(year): str(year)}
+                elif field == "topics.id":
+                    keys = {topic["id"]: topic["display_name"] for topic in work["topics"]}
+                else:
+                    institutions = [institution for authorship in work["authorships"] for institution in authorship["institutions"]]
+                    attribute = "country_code" if field.endswith("country_code") else "id"
+                    keys = {institution[attribute]: institution["country_code"] if attribute == "country_code"
+                            else institution["display_name"] for institution in institutions}
+                counts.update(list(keys))
+                labels.update(keys)
+        return json.dumps({
+            "meta": {"count": len(counts), "next_cursor": None},
+            "group_by": [{"key": key, "key_display_name": labels[key], "count": count} for key, count in counts.most_common()],
+        }).encode()
+
+    def __page(self, year, rors, offset):
+        key = (year, rors, offset)
+        if key not in self.pages:
+            works = self.__works(year, rors)
+            end = offset + self.per_page
+            self.pages[key] = json.dumps({
+                "meta": {"count": len(works), "next_cursor": str(end) if end < len(works) else None},
+                "results": works[offset:end],
+            }).encode()
+        return self.pages[key]
+
+    def send(self, request, **kwargs):
+        query = parse_qs(urlsplit(request.url).query)
+        filters = query.get("filter", [""])[0]
+        years = [int(year) for year in re.search(r"publication_year:([\d|]+)", filters).group(1).split("|")]
+        rors = tuple(re.findall(r"authorships\.institutions\.ror:(\w+)", filters)[1:])
+        cursor = query.get("cursor", ["*"])[0]
+        if "group_by" in query:
+            body = self.__groups(years, rors, query["group_by"][0]) if cursor == "*" else json.dumps({"group_by": []}).encode()
+        else:
+            body = self.__page(years[0], rors, 0 if cursor == "*" else int(cursor))
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        response.raw = io.BytesIO(body)
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class Stopwatch():
+    """Mesure la durée et le pic de mémoire Python (tracemalloc) de chaque étape"""
+
+    def __init__(self, works):
+        self.works = works
+        self.stages = {}
+
+    def measure(self, name, function, *args):
+        # Seules les allocations de l'étape sont suivies (tracemalloc ralentit aussi l'étape mesurée)
+        # Les messages de MyApi ne doivent pas se mêler au tableau des mesures : seul son journal est désactivé, les
+        # affichages de l'étape elle-même restent visibles
+        log = logging.getLogger("openalex")
+        disabled = log.disabled
+        log.disabled = True
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            log.disabled = disabled
+        # Tant que le nombre de publications n'est pas connu, il est déduit du résultat (téléchargement)
+        self.works = self.works or len(result)
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "works_per_s": round(self.works / seconds, 1) if seconds and self.works else None,
+            "peak_mb": round(peak / 2**20, 2),
+        }
+        print(f"  {name:<14}{seconds:>9.3f} s{self.stages[name]['works_per_s'] or 0:>12.0f} pub/s{peak / 2**20:>10.1f} Mo")
+        return result
+
+
+def run_stages(api, start, end, page_bodies):
+    """Exécute toutes les étapes sur la période ; api doit être configurée avec un transport sans réseau et sans cache.
+
+    Renvoie le nombre de publications et les mesures de chaque étape.
+    """
+    watch = Stopwatch(0)
+    works = watch.measure("fetch", lambda: list(api.iter_works(start, end, dedupe=False)))
+    # Décodage et projection des pages, comme pendant le téléchargement
+    parser = WorkParser()
+    watch.measure("decode", lambda: [parser.page(body) for body in page_bodies])
+
+    def dedupe():
+        deduplicator = WorkDeduplicator()
+        return [work for work in works if deduplicator.add(work)]
+    works = watch.measure("dedupe", dedupe)
+    # Les pays sont comptés au fil d'un nouveau téléchargement : la durée comprend la lecture depuis le transport
+    countries = watch.measure("collaborators", api.count_countries, start, end)
+    # Décompte côté serveur (group_by), calculé par le transport comme par OpenAlex
+    watch.measure("group_by", api.aggregate, "countries", start, end)
+
+    def count_topics():
+        topics = TopicAggregator({INSTITUTION_ROR, COLLABORATOR_ROR})
+        for work in works:
+            topics.add(work)
+        return topics.counts
+    topics = watch.measure("topics", count_topics)
+
+    def export_excel():
+        publications = PublicationAggregator((INSTITUTION_ROR,))
+        for work in works:
+            publications.add(work)
+        api.write_publications(publications.rows)
+    watch.measure("excel", export_excel)
+
+    def render_charts():
+        if topics:
+            api.write_topics_chart(topics)
+        return api.write_countries_chart(countries)
+    image = watch.measure("charts", render_charts)
+    watch.measure("word", api.write_country_report, start, end, image)
+    return len(works), watch.stages
+
+
+def git_revision():
+    """Révision courante du dépôt, None hors d'un dépôt git"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(history_path, corpus):
+    """Dernière mesure enregistrée pour le même corpus, None si aucune"""
+    last = None
+    if history_path and os.path.exists(history_path):
+        with open(history_path, encoding="utf-8") as file:
+            for line in file:
+                record = json.loads(line)
+                if record.get("corpus") == corpus:
+                    last = record
+    return last
+
+
+def record_run(history_path, corpus, works_count, stages):
+    """Ajoute la mesure à l'historique (une ligne JSON par exécution) et affiche l'écart avec la précédente"""
+    previous = previous_run(history_path, corpus)
+    if previous:
+        print(f"  évolution depuis la mesure du {previous['date']} ({previous['revision'] or 'révision inconnue'}) :")
+        for name, stage in stages.items():
+            before = previous["stages"].get(name)
+            if before and before["seconds"]:
+                change = (stage["seconds"] - before["seconds"]) / before["seconds"] * 100
+                print(f"  {name:<14}{change:>+8.1f} % de durée{stage['peak_mb'] - before['peak_mb']:>+10.1f} Mo")
+    if history_path:
+        with open(history_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({
+                "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "corpus": corpus,
+                "works": works_count,
+                "stages": stages,
+            }, ensure_ascii=False) + "\n")
+
+
+def serve(directory, port):
+    """Serveur local rejouant les réponses enregistrées (à utiliser avec MyApi(base_url="http://localhost:<port>/"))"""
+    replay = ReplayTransport(directory)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = replay.load(self.path)
+            self.send_response(200 if body is not None else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body or b"")))
+            self.end_headers()
+            self.wfile.write(body or b"")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"✅ Réponses de '{directory}' servies sur http://127.0.0.1:{port}/ (Ctrl+C pour arrêter)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mesure des performances de chaque étape, sans accès à OpenAlex")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Tailles des corpus synthétiques (nombre de publications)")
+    parser.add_argument("--years", default="2019-2023", help="Période couverte par les corpus (ex. 2019-2023)")
+    parser.add_argument("--replay", metavar="REPERTOIRE",
+                        help="Mesure sur des réponses enregistrées (cli.py --record) plutôt que sur des corpus synthétiques")
+    parser.add_argument("--serve", metavar="REPERTOIRE", help="Sert les réponses enregistrées sur un serveur local, sans mesure")
+    parser.add_argument("--port", type=int, default=8765, help="Port du serveur local (--serve)")
+    parser.add_argument("--history", default="benchmark_history.jsonl",
+                        help="Historique des mesures, complété à chaque exécution ('' pour ne pas l'enregistrer)")
+    parser.add_argument("--output-dir", help="Répertoire des fichiers produits (répertoire temporaire par défaut)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.serve:
+        serve(args.serve, args.port)
+        return 0
+
+    start, _, end = args.years.partition("-")
+    start, end = int(start), int(end or start)
+
+    with tempfile.TemporaryDirectory() as temporary:
+        for corpus, transport, bodies in corpora(args, start, end):
+            print(f"\n{corpus}\n  {'étape':<14}{'durée':>11}{'débit':>18}{'pic mémoire':>13}")
+            output_dir = os.path.join(args.output_dir or temporary, corpus.replace(":", "_"))
+            api = MyApi(cache_path=None, transport=transport, output_dir=output_dir, institution_rors=(INSTITUTION_ROR,))
+            works_count, stages = run_stages(api, start, end, bodies)
+            record_run(args.history, corpus, works_count, stages)
+    return 0
+
+
+def corpora(args, start, end):
+    """Corpus à mesurer (nom, transport, corps des pages), construits l'un après l'autre pour limiter la mémoire"""
+    if args.replay:
+        bodies = []
+        for name in sorted(os.listdir(args.replay)):
+            if name.endswith(".json"):
+                with open(os.path.join(args.replay, name), "rb") as file:
+                    bodies.append(file.read())
+        yield (f"replay:{os.path.basename(os.path.normpath(args.replay))}:{start}-{end}", ReplayTransport(args.replay), bodies)
+        return
+    for size in args.sizes:
+        print(f"Génération du corpus synthétique de {size} publications...")
+        transport = SyntheticTransport(size, start, end)
+        yield (f"synthetic:{size}:{start}-{end}", transport, transport.page_bodies())
+
+if __name__ == "__main__":
+    sys.exit(main())
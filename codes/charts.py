@@ -0,0 +1,101 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+# Formats d'image produits (le rapport Word n'accepte que les images matricielles : il reçoit toujours du PNG)
+FORMATS = ("png", "svg")
+
+# Nombre de graphiques à partir duquel render_many utilise un groupe de processus
+PROCESS_THRESHOLD = 8
+
+
+class BarChart():
+    """Description d'un diagramme en barres ; picklable, elle peut être rendue dans un autre processus"""
+
+    def __init__(self, counts, title, xlabel, ylabel, top=10, figsize=(10, 5), rotation=45, ha="center", fontsize=None):
+        # counts : Counter ou liste de (libellé, valeur) ; seules les top valeurs les plus grandes sont représentées,
+        # les ex aequo d'un Counter par libellé : le graphique ne dépend pas de l'ordre de réception des publications
+        if hasattr(counts, "most_common"):
+            items = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))[:top]
+        else:
+            items = list(counts)[:top]
+        if not items:
+            raise ValueError("Aucune donnée à représenter")
+        self.labels = [str(label) for label, _ in items]
+        self.values = [value for _, value in items]
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.figsize = figsize
+        self.rotation = rotation
+        self.ha = ha
+        self.fontsize = fontsize
+
+    def draw(self, figure):
+        axes = figure.add_subplot()
+        axes.bar(self.labels, self.values, color="royalblue")
+        axes.set_xlabel(self.xlabel)
+        axes.set_ylabel(self.ylabel)
+        axes.set_title(self.title)
+        axes.tick_params(axis="x", labelrotation=self.rotation, labelsize=self.fontsize)
+        for label in axes.get_xticklabels():
+            label.set_horizontalalignment(self.ha)
+        axes.grid(axis="y", linestyle="--", alpha=0.7)
+
+
+class LineChart():
+    """Description d'un graphique d'évolution annuelle (une courbe par série) ; picklable"""
+
+    def __init__(self, years, series, title, xlabel="Année", ylabel="Nombre de publications", figsize=(10, 5)):
+        # series : {nom de la série: [valeur pour chaque année de years]}
+        if not series:
+            raise ValueError("Aucune donnée à représenter")
+        self.years = list(years)
+        self.series = {str(name): list(values) for name, values in series.items()}
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.figsize = figsize
+
+    def draw(self, figure):
+        axes = figure.add_subplot()
+        for name, values in self.series.items():
+            axes.plot(self.years, values, marker="o", label=name)
+        axes.set_xticks(self.years)
+        axes.set_xlabel(self.xlabel)
+        axes.set_ylabel(self.ylabel)
+        axes.set_title(self.title)
+        axes.grid(linestyle="--", alpha=0.7)
+        if len(self.series) > 1:
+            axes.legend(fontsize=8)
+
+
+def render(chart, format="png", dpi=100):
+    """Rendu d'un graphique en mémoire (octets PNG ou SVG), sans état global : utilisable depuis plusieurs fils"""
+    if format not in FORMATS:
+        raise ValueError(f"Format d'image inconnu : {format} (formats acceptés : {', '.join(FORMATS)})")
+    # Une figure indépendante par rendu, attachée explicitement au moteur Agg (pyplot n'est pas utilisé)
+    figure = Figure(figsize=chart.figsize, dpi=dpi)
+    FigureCanvasAgg(figure)
+    chart.draw(figure)
+    buffer = BytesIO()
+    figure.savefig(buffer, format=format, dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def _render(args):
+    return render(*args)
+
+
+def render_many(charts, format="png", dpi=100, max_workers=None):
+    """Rendu de plusieurs graphiques (par année, par partenaire...) dans un groupe de processus, dans l'ordre reçu"""
+    charts = list(charts)
+    # Le démarrage des processus (import de matplotlib) coûte plus cher que quelques rendus
+    if len(charts) < PROCESS_THRESHOLD or max_workers == 1:
+        return [render(chart, format, dpi) for chart in charts]
+    # spawn : les processus ne doivent pas hériter des fils (interface, téléchargements) du processus appelant
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(_render, [(chart, format, dpi) for chart in charts]))
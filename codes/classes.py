@@ -1,74 +1,1538 @@
+import bisect
+import contextlib
+import copy
+import csv
+import hashlib
+import heapq
+import io
+import json
+import logging
+import os
+import queue
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from xml.sax.saxutils import escape, quoteattr
 import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 import pandas as pd
-from collections import Counter
+from collections import Counter, OrderedDict
 from docx import Document
 from docx.shared import Inches
-from matplotlib import pyplot as plt
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from charts import BarChart, LineChart, render, render_many
+
+try:
+    import xlsxwriter  # Moteur xlsx le plus rapide, utilisé s'il est installé
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import orjson  # Décodeur JSON le plus rapide, utilisé s'il est installé
+except ImportError:
+    orjson = None
+
+
+# Journal de l'application : les interfaces (gui.py, cli.py) y attachent leurs gestionnaires
+logger = logging.getLogger("openalex")
+
+
+def json_loads(data):
+    """Décodage JSON (orjson si disponible)"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def json_dumps(data):
+    """Encodage JSON compact (orjson si disponible)"""
+    return orjson.dumps(data).decode() if orjson else json.dumps(data, separators=(",", ":"))
+
+class OperationCancelled(Exception):
+    """Levée lorsqu'une opération est interrompue pendant le téléchargement d'une page"""
+
+
+class ApiError(RuntimeError):
+    """Réponse d'erreur d'OpenAlex (après les nouvelles tentatives éventuelles) ; status : code HTTP"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class ProgressTracker():
+    """Suivi de l'avancement d'une extraction : pages, publications reçues, total annoncé par OpenAlex, débit et temps restant"""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.records = 0
+        self.total = 0
+        self.started = time.monotonic()
+
+    def add_total(self, count):
+        """Ajoute le nombre de publications annoncé pour un flux (meta.count, ou taille de l'année en cache)"""
+        with self.lock:
+            self.total += count
+        self.__notify()
+
+    def advance(self, records):
+        """Enregistre la réception d'une page de records publications"""
+        with self.lock:
+            self.pages += 1
+            self.records += records
+        self.__notify()
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            rate = self.records / elapsed if elapsed > 0 else 0.0
+            remaining = max(self.total - self.records, 0)
+            return {
+                "pages": self.pages,
+                "records": self.records,
+                "total": self.total,
+                "elapsed": elapsed,
+                "rate": rate,
+                "eta": remaining / rate if rate > 0 else None,
+            }
+
+    def __notify(self):
+        if self.callback:
+            self.callback(self.snapshot())
+
+
+class Metrics():
+    """Mesures d'exécution partagées par tous les fils : requêtes (statut, latence, volume), pages, publications,
+    nouvelles tentatives, lectures du cache et durée de chaque étape.
+
+    Exportables en JSON ou au format textfile de Prometheus (node_exporter).
+    """
+    # Bornes (en secondes) de l'histogramme des latences des requêtes
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 
-class MyApi():
     def __init__(self):
-        self.url = "https://api.openalex.org/"
+        self.lock = threading.Lock()
+        # (nom, ((étiquette, valeur), ...)) -> valeur
+        self.counters = Counter()
+        self.latency_buckets = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe_request(self, seconds, size, status):
+        """Enregistre une requête terminée : durée (jusqu'à la fin de la lecture du corps), octets reçus et statut HTTP"""
+        with self.lock:
+            self.latency_buckets[bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+            self.counters[("requests_total", (("status", str(status)),))] += 1
+            self.counters[("response_bytes_total", ())] += size
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Mesure la durée d'une étape (téléchargement, export, graphiques, rapport word...)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.inc("stage_seconds_total", seconds, stage=name)
+            self.inc("stage_runs_total", stage=name)
+            logger.debug(f"Étape {name} : {seconds:.3f} s", extra={"event": "stage", "stage": name, "seconds": round(seconds, 4)})
+
+    def value(self, name, **labels):
+        """Somme d'un compteur sur toutes les étiquettes, ou pour les étiquettes données"""
+        with self.lock:
+            return sum(value for (key, key_labels), value in self.counters.items()
+                       if key == name and set(labels.items()) <= set(key_labels))
+
+    def latency_quantile(self, quantile):
+        """Borne supérieure de l'intervalle de l'histogramme contenant le quantile (None sans requête, inf au-delà de 30 s)"""
+        with self.lock:
+            buckets = list(self.latency_buckets)
+        count = sum(buckets)
+        if not count:
+            return None
+        cumulative = 0
+        for bound, bucket in zip(self.LATENCY_BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket
+            if cumulative >= quantile * count:
+                return bound
+
+    def records_per_second(self):
+        """Débit des extractions : publications reçues par seconde de téléchargement"""
+        seconds = self.value("stage_seconds_total", stage="fetch")
+        return self.value("records_total") / seconds if seconds else 0.0
+
+    def snapshot(self):
+        """État des mesures sous forme de dictionnaire sérialisable (JSON, transmission entre processus)"""
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())]
+            latency = {"buckets": list(self.latency_buckets), "sum": self.latency_sum}
+        return {"counters": counters, "latency": latency, "records_per_second": self.records_per_second()}
+
+    def merge(self, snapshot):
+        """Ajoute les mesures d'un autre processus (snapshot())"""
+        with self.lock:
+            for counter in snapshot["counters"]:
+                self.counters[(counter["name"], tuple(sorted(counter["labels"].items())))] += counter["value"]
+            for i, bucket in enumerate(snapshot["latency"]["buckets"]):
+                self.latency_buckets[i] += bucket
+            self.latency_sum += snapshot["latency"]["sum"]
+
+    def summary(self):
+        """Résumé d'une ligne pour l'interface graphique"""
+        median = self.latency_quantile(0.5)
+        slowest = self.latency_quantile(0.95)
+        text = f"{self.value('requests_total')} requête(s)"
+        if median is not None:
+            text += f" (latence médiane ≤ {median:g} s, 95 % ≤ {slowest:g} s)"
+        return (f"{text} - {self.value('response_bytes_total') / 2**20:.1f} Mo - {self.value('pages_total')} page(s) - "
+                f"{self.value('records_total')} publication(s), {self.records_per_second():.0f}/s - "
+                f"{self.value('duplicates_total')} doublon(s) écarté(s) - "
+                f"{self.value('retries_total')} nouvelle(s) tentative(s) - {self.value('cache_hits_total')} lecture(s) du cache")
+
+    def write(self, path):
+        """Enregistre les mesures : format textfile de Prometheus si le fichier se termine par .prom, JSON sinon"""
+        content = self.__prometheus() if path.endswith(".prom") else json.dumps(self.snapshot(), indent=2)
+        # Écriture atomique : le collecteur ne lit jamais un fichier incomplet
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(path + ".tmp", path)
+
+    def __prometheus(self):
+        lines = []
+        snapshot = self.snapshot()
+        declared = set()
+        for counter in snapshot["counters"]:
+            name = f"openalex_{counter['name']}"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            labels = ",".join(f'{key}="{value}"' for key, value in counter["labels"].items())
+            lines.append(f"{name}{{{labels}}} {counter['value']:g}" if labels else f"{name} {counter['value']:g}")
+
+        lines.append("# TYPE openalex_request_duration_seconds histogram")
+        cumulative = 0
+        for bound, bucket in zip(self.LATENCY_BUCKETS + (float("inf"),), snapshot["latency"]["buckets"]):
+            cumulative += bucket
+            lines.append(f'openalex_request_duration_seconds_bucket{{le="{"+Inf" if bound == float("inf") else f"{bound:g}"}"}} {cumulative}')
+        lines.append(f"openalex_request_duration_seconds_sum {snapshot['latency']['sum']:g}")
+        lines.append(f"openalex_request_duration_seconds_count {cumulative}")
+        lines.append("# TYPE openalex_records_per_second gauge")
+        lines.append(f"openalex_records_per_second {snapshot['records_per_second']:g}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par message du journal, avec les champs structurés passés dans extra (event, url, seconds...)"""
+
+    STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.STANDARD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _WorkerError():
+    """Exception levée dans un fil de téléchargement, transmise au générateur consommateur"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+# Marqueur de fin de téléchargement d'une année
+_YEAR_DONE = object()
+
+
+class Institution():
+    """Institution d'une affiliation, réduite aux champs utilisés par les analyses"""
+    __slots__ = ("id", "ror", "country_code", "display_name")
+
+    def __init__(self, id=None, ror=None, country_code=None, display_name=None):
+        self.id = id
+        self.ror = ror
+        self.country_code = country_code
+        self.display_name = display_name
+
+
+class Authorship():
+    """Affiliation d'un auteur : position et institutions (les noms et affiliations brutes ne sont pas conservés)"""
+    __slots__ = ("author_position", "institutions")
+
+    def __init__(self, author_position=None, institutions=()):
+        self.author_position = author_position
+        self.institutions = institutions
+
+
+class WorkRecord():
+    """Publication OpenAlex projetée sur les champs nécessaires aux analyses (sujets réduits à leur nom)"""
+    __slots__ = ("id", "publication_year", "updated_date", "display_name", "doi", "authorships", "topics")
+
+    def __init__(self, id=None, publication_year=None, updated_date=None, display_name=None, doi=None,
+                 authorships=(), topics=()):
+        self.id = id
+        self.publication_year = publication_year
+        self.updated_date = updated_date
+        self.display_name = display_name
+        self.doi = doi
+        self.authorships = authorships
+        self.topics = topics
+
+    def institutions(self):
+        """Institutions de toutes les affiliations, dans l'ordre des auteurs (avec répétitions)"""
+        return [institution for authorship in self.authorships for institution in authorship.institutions]
+
+    def countries(self):
+        """Pays distincts des institutions, dans l'ordre des auteurs"""
+        return list(dict.fromkeys(institution.country_code for institution in self.institutions() if institution.country_code))
+
+    def partner_rors(self, institution_rors=()):
+        """ROR distincts des institutions partenaires (toutes sauf celles données), dans l'ordre des auteurs"""
+        return list(dict.fromkeys(institution.ror for institution in self.institutions()
+                                  if institution.ror and institution.ror not in institution_rors))
+
+    def primary_topic(self):
+        """Sujet principal : le premier, OpenAlex classant les sujets par score décroissant"""
+        return self.topics[0] if self.topics else None
+
+    def to_json(self):
+        """Projection au format OpenAlex (relue par WorkParser), utilisée par le cache local"""
+        return {
+            "id": self.id,
+            "publication_year": self.publication_year,
+            "updated_date": self.updated_date,
+            "display_name": self.display_name,
+            "doi": self.doi,
+            "authorships": [
+                {"author_position": authorship.author_position, "institutions": [
+                    {"id": institution.id, "ror": institution.ror, "country_code": institution.country_code,
+                     "display_name": institution.display_name}
+                    for institution in authorship.institutions
+                ]}
+                for authorship in self.authorships
+            ],
+            "topics": [{"display_name": topic} for topic in self.topics],
+        }
+
+
+class WorkParser():
+    """Décode les pages OpenAlex en WorkRecord ; chaque institution et chaque sujet n'existe qu'une fois en mémoire"""
+
+    def __init__(self):
+        self.institutions = {}
+        self.topics = {}
+
+    def page(self, body):
+        """Décode une page de résultats : (métadonnées, publications projetées)"""
+        data = json_loads(body)
+        return data.get("meta", {}), [self.work(work) for work in data.get("results") or ()]
+
+    def work(self, data):
+        """Projection d'une publication décodée (dictionnaire OpenAlex complet ou déjà projeté)"""
+        return WorkRecord(
+            data.get("id"), data.get("publication_year"), data.get("updated_date"), data.get("display_name"), data.get("doi"),
+            tuple(
+                Authorship(authorship.get("author_position"),
+                           tuple(self.__institution(institution) for institution in authorship.get("institutions") or ()))
+                for authorship in data.get("authorships") or ()
+            ),
+            tuple(self.__topic(topic.get("display_name")) for topic in data.get("topics") or ()),
+        )
+
+    def __institution(self, data):
+        key = data.get("id")
+        institution = self.institutions.get(key) if key else None
+        if institution is None:
+            institution = Institution(key, data.get("ror"), data.get("country_code"), data.get("display_name"))
+            if key:
+                self.institutions[key] = institution
+        return institution
+
+    def __topic(self, name):
+        return self.topics.setdefault(name, name) if name is not None else None
+
+
+class WorkCache():
+    """Stockage local (SQLite) des publications OpenAlex, indexé par identifiant de publication"""
+
+    def __init__(self, path="openalex_cache.sqlite", parser=None):
+        self.path = path
+        # Les publications sont stockées sous leur forme projetée et relues en WorkRecord
+        self.parser = parser or WorkParser()
+        self.lock = threading.Lock()
+        # Nombre de modifications des publications rattachées à chaque requête depuis l'ouverture (voir version())
+        self.versions = Counter()
+        # Le délai d'attente permet à plusieurs processus (traitements par lots) de partager le même fichier
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS works (
+                    id TEXT PRIMARY KEY,
+                    publication_year INTEGER,
+                    updated_date TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS query_works (
+                    query_key TEXT NOT NULL,
+                    work_id TEXT NOT NULL,
+                    PRIMARY KEY (query_key, work_id)
+                );
+                CREATE TABLE IF NOT EXISTS syncs (
+                    query_key TEXT PRIMARY KEY,
+                    last_sync TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS partitions (
+                    institution TEXT NOT NULL,
+                    collaborator TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    publications INTEGER NOT NULL,
+                    computed_at TEXT NOT NULL,
+                    PRIMARY KEY (institution, collaborator, year)
+                );
+                CREATE TABLE IF NOT EXISTS aggregates (
+                    institution TEXT NOT NULL,
+                    collaborator TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    dimension TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (institution, collaborator, year, dimension, key)
+                );
+            """)
+
+    def last_sync(self, query_key):
+        """Date de la dernière synchronisation d'une requête (None si jamais synchronisée)"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT last_sync FROM syncs WHERE query_key = ?", (query_key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, query_key, works):
+        """Insère ou met à jour les publications (WorkRecord) et les rattache à la requête"""
+        rows = [
+            (work.id, work.publication_year, work.updated_date, json_dumps(work.to_json()))
+            for work in works if work.id
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO works (id, publication_year, updated_date, data) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO query_works (query_key, work_id) VALUES (?, ?)",
+                [(query_key, row[0]) for row in rows]
+            )
+            if rows:
+                self.versions[query_key] += 1
+
+    def reset(self, query_key):
+        """Détache toutes les publications d'une requête et oublie sa synchronisation (avant un téléchargement complet)"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM query_works WHERE query_key = ?", (query_key,))
+            self.connection.execute("DELETE FROM syncs WHERE query_key = ?", (query_key,))
+            self.versions[query_key] += 1
+
+    def detach_moved(self, query_key, year):
+        """Détache d'une requête annuelle les publications dont l'année de publication a changé ; renvoie leur nombre"""
+        with self.lock, self.connection:
+            detached = self.connection.execute(
+                "DELETE FROM query_works WHERE query_key = ? AND work_id IN "
+                "(SELECT id FROM works WHERE publication_year IS NOT ?)", (query_key, year)
+            ).rowcount
+            if detached:
+                self.versions[query_key] += 1
+            return detached
+
+    def version(self, query_key):
+        """Numéro de version des publications d'une requête : change à chaque modification faite par ce processus"""
+        with self.lock:
+            return self.versions[query_key]
+
+    def mark_synced(self, query_key, sync_date):
+        """Enregistre la date de synchronisation d'une requête"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO syncs (query_key, last_sync) VALUES (?, ?)",
+                (query_key, sync_date)
+            )
+
+    def count(self, query_key):
+        """Nombre de publications rattachées à une requête"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM query_works WHERE query_key = ?", (query_key,)
+            ).fetchone()[0]
+
+    def iter_load(self, query_key, chunk_size=200):
+        """Parcourt les publications rattachées à une requête, par paquets de chunk_size"""
+        last_id = ""
+        while True:
+            # Pagination par clé : chaque paquet est une requête indépendante, le verrou n'est pas conservé entre les paquets
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT q.work_id, w.data FROM query_works q JOIN works w ON w.id = q.work_id "
+                    "WHERE q.query_key = ? AND q.work_id > ? ORDER BY q.work_id LIMIT ?",
+                    (query_key, last_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [self.parser.work(json_loads(row[1])) for row in rows]
+
+    def store_partition(self, institution, collaborator, year, partition):
+        """Enregistre les décomptes d'une année (publications, pays, sujets), en remplaçant les précédents"""
+        collaborator = collaborator or ""
+        rows = [
+            (institution, collaborator, year, dimension, str(key), count)
+            for dimension in YearlyAggregator.DIMENSIONS
+            for key, count in partition[dimension].items() if key is not None
+        ]
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM aggregates WHERE institution = ? AND collaborator = ? AND year = ?", (institution, collaborator, year)
+            )
+            self.connection.executemany(
+                "INSERT INTO aggregates (institution, collaborator, year, dimension, key, count) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO partitions (institution, collaborator, year, publications, computed_at) VALUES (?, ?, ?, ?, ?)",
+                (institution, collaborator, year, partition["publications"], datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+            )
+
+    def load_partition(self, institution, collaborator, year, computed_since=None):
+        """Décomptes enregistrés d'une année, None s'ils n'ont pas été calculés ou ont été invalidés
+
+        computed_since : date (AAAA-MM-JJ) ; des décomptes calculés avant cette date sont ignorés.
+        """
+        collaborator = collaborator or ""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT publications FROM partitions WHERE institution = ? AND collaborator = ? AND year = ? AND computed_at >= ?",
+                (institution, collaborator, year, computed_since or "")
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self.connection.execute(
+                "SELECT dimension, key, count FROM aggregates WHERE institution = ? AND collaborator = ? AND year = ?",
+                (institution, collaborator, year)
+            ).fetchall()
+        partition = YearlyAggregator.empty_partition()
+        partition["publications"] = row[0]
+        for dimension, key, count in rows:
+            partition[dimension][key] = count
+        return partition
+
+    def invalidate_partitions(self, institution, year):
+        """Supprime les décomptes d'une année (tous collaborateurs confondus) après une mise à jour de ses publications"""
+        with self.lock, self.connection:
+            for table in ("partitions", "aggregates"):
+                self.connection.execute(f"DELETE FROM {table} WHERE institution = ? AND year = ?", (institution, year))
+
+
+class WorkDeduplicator():
+    """Écarte au fil du téléchargement les autres versions d'une publication déjà reçue (prépublication, version publiée...)
+
+    Une publication est un doublon si son identifiant, son DOI normalisé ou son titre normalisé la même année a déjà été vu.
+    Chaque clé est cherchée dans un index par hachage : le coût est linéaire en nombre de publications.
+
+    La première version reçue est conservée et complétée par les suivantes : ses champs descriptifs vides (MERGED_FIELDS,
+    par exemple le DOI d'une prépublication dont la version publiée arrive ensuite) sont remplis en place. Les
+    affiliations et sujets, déjà comptés par les agrégateurs, ne sont pas modifiés ; PublicationAggregator et WorkTable
+    lisent les champs descriptifs au moment de l'export.
+    """
+    KEYS = ("id", "doi", "title")
+
+    # Champs complétés depuis les autres versions
+    MERGED_FIELDS = ("doi", "display_name")
+
+    # Titres normalisés plus courts ignorés : « Editorial », « Introduction »... ne désignent pas une publication précise
+    MIN_TITLE_LENGTH = 20
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        # Clé -> version conservée
+        self.indexes = {key: {} for key in self.KEYS}
+        self.duplicates = Counter()
+
+    def add(self, work):
+        """True si la publication est nouvelle, False si c'est une autre version (fusionnée dans celle déjà reçue)"""
+        keys = self.__keys(work)
+        reason = next((key for key in self.KEYS if keys[key] is not None and keys[key] in self.indexes[key]), None)
+        kept = work if reason is None else self.indexes[reason][keys[reason]]
+        merged = [field for field in self.MERGED_FIELDS if kept is not work and not getattr(kept, field) and getattr(work, field)]
+        for field in merged:
+            setattr(kept, field, getattr(work, field))
+        # Les clés d'un doublon (et celles acquises par la fusion) mènent aussi à la version conservée : une troisième
+        # version partageant le DOI de la deuxième est reconnue
+        for keys in (keys, self.__keys(kept)) if merged else (keys,):
+            for key, value in keys.items():
+                if value is not None:
+                    self.indexes[key].setdefault(value, kept)
+        if reason is None:
+            return True
+        self.duplicates[reason] += 1
+        if self.metrics is not None:
+            self.metrics.inc("duplicates_total", key=reason)
+        return False
+
+    def __keys(self, work):
+        title = normalize_title(work.display_name)
+        return {
+            "id": work.id,
+            "doi": normalize_doi(work.doi),
+            "title": (title, work.publication_year) if len(title) >= self.MIN_TITLE_LENGTH else None,
+        }
+
+
+class CountryAggregator():
+    """Compte, au fil des publications reçues, les pays des institutions des co-auteurs (une fois par publication si per_work)"""
+
+    def __init__(self, per_work=False):
+        self.per_work = per_work
+        self.counts = Counter()
+
+    def add(self, work):
+        if self.per_work:
+            self.counts.update(work.countries())
+            return
+        for authorship in work.authorships:
+            for institution in authorship.institutions:
+                if institution.country_code:
+                    self.counts[institution.country_code] += 1
+
+
+class TopicAggregator():
+    """Compte les sujets des publications reçues, éventuellement limitées à celles co-signées par toutes les institutions données"""
+
+    def __init__(self, required_rors=None):
+        self.required_rors = set(required_rors or ())
+        self.counts = Counter()
+
+    def add(self, work):
+        if self.required_rors:
+            work_rors = {institution.ror for institution in work.institutions() if institution.ror}
+            if not self.required_rors.issubset(work_rors):
+                return
+        self.counts.update(work.topics)
+
+
+class YearlyAggregator():
+    """Décomptes par année de publication : nombre de publications, pays (chaque institution compte) et sujets
+
+    Avec required_rors, seules les publications co-signées par toutes les institutions données sont comptées.
+    """
+    DIMENSIONS = ("countries", "topics")
+
+    def __init__(self, required_rors=None):
+        self.required_rors = set(required_rors or ())
+        self.partitions = {}
+
+    @staticmethod
+    def empty_partition():
+        return {"publications": 0, "countries": Counter(), "topics": Counter()}
+
+    def add(self, work):
+        institutions = work.institutions()
+        if self.required_rors and not self.required_rors.issubset({institution.ror for institution in institutions}):
+            return
+        partition = self.partitions.get(work.publication_year)
+        if partition is None:
+            partition = self.partitions[work.publication_year] = self.empty_partition()
+        partition["publications"] += 1
+        partition["countries"].update(institution.country_code for institution in institutions if institution.country_code)
+        partition["topics"].update(work.topics)
+
+
+class PublicationAggregator():
+    """Liste Excel des publications, y compris les champs dérivés
+
+    Les partenaires sont les institutions autres que celles de institution_rors (ROR complets). Les lignes sont construites
+    à la lecture de rows : elles reprennent les champs complétés par WorkDeduplicator après la réception.
+    """
+
+    def __init__(self, institution_rors=()):
+        self.institution_rors = set(institution_rors)
+        self.works = []
+
+    def add(self, work):
+        self.works.append(work)
+
+    @property
+    def rows(self):
+        return [{
+            "Titre": work.display_name,
+            "Année": work.publication_year,
+            "Lien vers l'article": work.doi,
+            "Pays collaborateurs": ", ".join(work.countries()),
+            "Partenaires (ROR)": ", ".join(work.partner_rors(self.institution_rors)),
+            "Sujet principal": work.primary_topic(),
+        } for work in self.works]
+
+
+class WorkTable():
+    """Tables en colonnes (publications, affiliations, institutions, sujets) pour les agrégations vectorisées
+
+    La table works porte aussi les champs dérivés de chaque publication (pays, partenaires hors institution_rors,
+    sujet principal) repris par l'export Excel. Ses champs descriptifs (identifiant, titre, DOI) sont lus à la construction
+    des tables : ils reprennent les champs complétés par WorkDeduplicator après la réception.
+    """
+    DESCRIPTIVE_FIELDS = {"id": "id", "title": "display_name", "doi": "doi"}
+
+    def __init__(self, institution_rors=()):
+        self.institution_rors = set(institution_rors)
+        self.__works = []
+        # Colonnes accumulées au fil des publications ; les DataFrames sont construits à la première agrégation
+        self.__columns = {
+            "works": {"work": [], "publication_year": [], "countries": [], "partners": [], "primary_topic": []},
+            "authorships": {"work": [], "authorship": [], "author_position": []},
+            "institutions": {"work": [], "authorship": [], "ror": [], "country_code": []},
+            "topics": {"work": [], "topic": []},
+        }
+        self.__tables = None
+        # Index de collaboration construit pendant le même passage (build_work_table avec partners), sinon None
+        self.collaboration_index = None
+
+    def add(self, work):
+        """Aplatit une publication dans les colonnes (seule étape parcourant les publications une à une)"""
+        columns = self.__columns
+        index = len(self.__works)
+        self.__works.append(work)
+        for name, value in (("work", index), ("publication_year", work.publication_year),
+                            ("countries", ", ".join(work.countries())),
+                            ("partners", ", ".join(work.partner_rors(self.institution_rors))),
+                            ("primary_topic", work.primary_topic())):
+            columns["works"][name].append(value)
+
+        for position, authorship in enumerate(work.authorships):
+            columns["authorships"]["work"].append(index)
+            columns["authorships"]["authorship"].append(position)
+            columns["authorships"]["author_position"].append(authorship.author_position)
+            for institution in authorship.institutions:
+                columns["institutions"]["work"].append(index)
+                columns["institutions"]["authorship"].append(position)
+                columns["institutions"]["ror"].append(institution.ror)
+                columns["institutions"]["country_code"].append(institution.country_code)
+
+        for topic in work.topics:
+            columns["topics"]["work"].append(index)
+            columns["topics"]["topic"].append(topic)
+        self.__tables = None
+
+    def table(self, name):
+        """DataFrame d'une table : works, authorships, institutions ou topics"""
+        if self.__tables is None:
+            # Tables construites à part puis publiées ensemble : la table peut être partagée entre plusieurs fils
+            tables = {}
+            for table_name, columns in self.__columns.items():
+                if table_name == "works":
+                    columns = {**columns, **{column: [getattr(work, field) for work in self.__works]
+                                             for column, field in self.DESCRIPTIVE_FIELDS.items()}}
+                df = pd.DataFrame(columns)
+                # Types compacts : catégories pour les valeurs répétées, entiers 32 bits pour les index
+                for column in df.columns.intersection(["ror", "country_code", "topic", "author_position"]):
+                    df[column] = df[column].astype("category")
+                for column in df.columns.intersection(["work", "authorship"]):
+                    df[column] = df[column].astype("int32")
+                if "publication_year" in df:
+                    df["publication_year"] = pd.to_numeric(df["publication_year"], errors="coerce")
+                tables[table_name] = df
+            self.__tables = tables
+        return self.__tables[name]
+
+    def publications(self):
+        """Liste des publications au format de l'export Excel"""
+        return self.table("works")[["title", "publication_year", "doi", "countries", "partners", "primary_topic"]].rename(
+            columns={"title": "Titre", "publication_year": "Année", "doi": "Lien vers l'article",
+                     "countries": "Pays collaborateurs", "partners": "Partenaires (ROR)", "primary_topic": "Sujet principal"}
+        )
+
+    def country_counts(self, per_work=False, required_rors=None):
+        """Nombre d'apparitions de chaque pays (une seule fois par publication si per_work=True)"""
+        institutions = self.table("institutions").dropna(subset=["country_code"])
+        if required_rors:
+            institutions = institutions[institutions["work"].isin(self.__works_with(required_rors))]
+        if per_work:
+            institutions = institutions.drop_duplicates(subset=["work", "country_code"])
+        return self.__to_counter(institutions["country_code"].value_counts())
+
+    def topic_counts(self, required_rors=None):
+        """Nombre de publications par sujet, éventuellement limitées à celles co-signées par toutes les institutions données"""
+        topics = self.table("topics")
+        if required_rors:
+            topics = topics[topics["work"].isin(self.__works_with(required_rors))]
+        return self.__to_counter(topics["topic"].value_counts())
+
+    def year_counts(self):
+        """Nombre de publications par année"""
+        return self.__to_counter(self.table("works")["publication_year"].dropna().astype(int).value_counts())
+
+    def ror_pair_counts(self):
+        """Nombre de publications co-signées par chaque paire d'institutions (ROR)"""
+        institutions = self.table("institutions").dropna(subset=["ror"])
+        rors = institutions[["work", "ror"]].astype({"ror": str}).drop_duplicates()
+        pairs = rors.merge(rors, on="work", suffixes=("_a", "_b"))
+        pairs = pairs[pairs["ror_a"] < pairs["ror_b"]]
+        return self.__to_counter(pairs.groupby(["ror_a", "ror_b"]).size())
+
+    def __works_with(self, required_rors):
+        """Index des publications où toutes les institutions demandées sont présentes"""
+        required_rors = set(required_rors)
+        institutions = self.table("institutions")
+        matching = institutions[institutions["ror"].isin(required_rors)]
+        per_work = matching.groupby("work", observed=True)["ror"].nunique()
+        return per_work.index[per_work == len(required_rors)]
+
+    def __to_counter(self, series):
+        """Conversion d'une série de décomptes en Counter (format attendu par les graphiques et exports)"""
+        return Counter({key: int(count) for key, count in series.items() if count})
+
+
+class CollaborationIndex():
+    """Index des co-publications entre institutions, construit en un seul passage sur les publications
+
+    Pour chaque partenaire de l'institution de référence : nombre de co-publications, sujets, années et pays.
+    Les arêtes entre toutes les institutions co-signataires sont conservées dans une structure creuse (paire -> nombre).
+    """
+
+    def __init__(self, institution_ror):
+        self.institution_ror = institution_ror
+        self.partners = {}
+        self.edges = Counter()
+        self.names = {}
+        self.countries = {}
+
+    def add(self, work):
+        rors = set()
+        work_countries = set()
+        for institution in work.institutions():
+            ror = institution.ror
+            if institution.country_code:
+                work_countries.add(institution.country_code)
+            if not ror:
+                continue
+            rors.add(ror)
+            self.names.setdefault(ror, institution.display_name or ror)
+            self.countries.setdefault(ror, institution.country_code)
+
+        ordered = sorted(rors)
+        for i, ror_a in enumerate(ordered):
+            for ror_b in ordered[i + 1:]:
+                self.edges[(ror_a, ror_b)] += 1
+
+        if self.institution_ror not in rors:
+            return
+        topics = work.topics
+        for ror in rors - {self.institution_ror}:
+            partner = self.partners.setdefault(ror, {"count": 0, "topics": Counter(), "years": Counter(), "countries": Counter()})
+            partner["count"] += 1
+            partner["topics"].update(topics)
+            partner["years"][work.publication_year] += 1
+            partner["countries"].update(work_countries)
+
+    def top_partners(self, k=10):
+        """Les k partenaires ayant le plus de co-publications : liste de (ROR, nom, pays, nombre)"""
+        top = heapq.nlargest(k, self.partners.items(), key=lambda item: item[1]["count"])
+        return [(ror, self.names.get(ror), self.countries.get(ror), stats["count"]) for ror, stats in top]
+
+    def partner(self, ror):
+        """Statistiques d'un partenaire (None s'il n'a aucune co-publication)"""
+        return self.partners.get(f"https://ror.org/{short_ror(ror)}")
+
+    def partner_topics(self, ror):
+        """Sujets des co-publications avec un partenaire"""
+        partner = self.partner(ror)
+        return Counter(partner["topics"]) if partner else Counter()
+
+    def write_edge_list(self, path):
+        """Export des arêtes (source, cible, poids) au format csv"""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["source", "target", "weight"])
+            for (ror_a, ror_b), weight in self.edges.items():
+                writer.writerow([ror_a, ror_b, weight])
+
+    def write_graphml(self, path):
+        """Export du graphe de co-publication au format GraphML (Gephi, networkx, yEd...)"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+            f.write('  <key id="name" for="node" attr.name="name" attr.type="string"/>\n')
+            f.write('  <key id="country" for="node" attr.name="country" attr.type="string"/>\n')
+            f.write('  <key id="weight" for="edge" attr.name="weight" attr.type="int"/>\n')
+            f.write('  <graph id="collaborations" edgedefault="undirected">\n')
+            for ror, name in self.names.items():
+                f.write(f'    <node id={quoteattr(ror)}><data key="name">{escape(str(name))}</data>'
+                        f'<data key="country">{escape(str(self.countries.get(ror) or ""))}</data></node>\n')
+            for (ror_a, ror_b), weight in self.edges.items():
+                f.write(f'    <edge source={quoteattr(ror_a)} target={quoteattr(ror_b)}><data key="weight">{weight}</data></edge>\n')
+            f.write('  </graph>\n</graphml>\n')
+
+
+class Exporter():
+    """Écriture des tableaux de résultats dans le répertoire de sortie, aux formats xlsx, csv et/ou parquet"""
+
+    FORMATS = ("xlsx", "csv", "parquet")
+
+    def __init__(self, output_dir=".", formats=("xlsx",), metrics=None):
+        unknown = set(formats) - set(self.FORMATS)
+        if unknown:
+            raise ValueError(f"Format(s) d'export inconnu(s) : {', '.join(sorted(unknown))}")
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        # Durée des exports (étape "export"), si des mesures sont collectées
+        self.metrics = metrics
+
+    def path(self, filename):
+        """Chemin d'un fichier de sortie (le répertoire est créé au besoin)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, filename)
+
+    def export(self, df, name, sheet_size=None):
+        """Écrit le DataFrame dans chaque format configuré ; les formats sont écrits en parallèle"""
+        writers = {"xlsx": self.__write_xlsx, "csv": self.__write_csv, "parquet": self.__write_parquet}
+        paths = [self.path(f"{name}.{fmt}") for fmt in self.formats]
+        with self.metrics.stage("export") if self.metrics else contextlib.nullcontext(), \
+                ThreadPoolExecutor(max_workers=len(self.formats)) as executor:
+            futures = [
+                executor.submit(writers[fmt], df, path, sheet_size)
+                for fmt, path in zip(self.formats, paths)
+            ]
+            for future in futures:
+                future.result()
+        return paths
+
+    def __write_xlsx(self, df, path, sheet_size=None):
+        """Écriture xlsx en flux (xlsxwriter en mémoire constante, sinon openpyxl en mode write-only)"""
+        # Feuilles numérotées (Sheet_1, Sheet_2...) si les lignes sont réparties, sinon une seule feuille Sheet1
+        names = (lambda i: f"Sheet_{i + 1}") if sheet_size else (lambda i: "Sheet1")
+        sheet_size = sheet_size or max(len(df), 1)
+        # Au moins une feuille, même sans aucune ligne
+        chunks = [df.iloc[i:i + sheet_size] for i in range(0, len(df), sheet_size)] or [df]
+
+        if xlsxwriter is not None:
+            # En mémoire constante, xlsxwriter n'accepte que des lignes complètes écrites dans l'ordre : pandas écrivant
+            # colonne par colonne, les lignes sont écrites ici une à une. Les chaînes restent du texte, comme avec openpyxl
+            # (sinon les listes d'URL deviennent des liens, ignorés au-delà de 2079 caractères, et "=..." une formule)
+            workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False, "strings_to_formulas": False})
+            for i, chunk in enumerate(chunks):
+                sheet = workbook.add_worksheet(names(i))
+                for index, row in enumerate(self.__rows(chunk)):
+                    sheet.write_row(index, 0, row)
+            workbook.close()
+            return
+
+        workbook = Workbook(write_only=True)
+        for i, chunk in enumerate(chunks):
+            sheet = workbook.create_sheet(names(i))
+            for row in self.__rows(chunk):
+                sheet.append([self.__text_cell(sheet, value) if isinstance(value, str) and value.startswith("=") else value
+                              for value in row])
+        workbook.save(path)
+
+    def __text_cell(self, sheet, value):
+        """Cellule texte explicite : openpyxl écrirait une chaîne commençant par "=" comme une formule"""
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.data_type = "s"
+        return cell
+
+    def __rows(self, chunk):
+        """En-tête puis lignes d'une feuille ; les valeurs manquantes (NaN) deviennent des cellules vides"""
+        yield list(chunk.columns)
+        yield from chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+    def __write_csv(self, df, path, sheet_size=None):
+        # utf-8-sig : les accents s'affichent correctement à l'ouverture dans Excel
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+
+    def __write_parquet(self, df, path, sheet_size=None):
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError as e:
+            raise ImportError("L'export parquet nécessite pyarrow (pip install pyarrow)") from e
+
+
+def short_ror(ror):
+    """Identifiant ROR court (0020snb74) à partir de l'URL complète (https://ror.org/0020snb74)"""
+    return ror.strip().rstrip("/").rsplit("/", 1)[-1]
+
+
+def normalize_doi(doi):
+    """DOI sans préfixe de résolveur, en minuscules (les DOI ne sont pas sensibles à la casse) ; None si absent"""
+    if not doi:
+        return None
+    doi = doi.strip().lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/", "doi:"):
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+            break
+    return doi or None
+
+
+def normalize_title(title):
+    """Titre comparable : sans accents ni ponctuation, en minuscules, espaces réduits ('' si absent)"""
+    if not title:
+        return ""
+    title = unicodedata.normalize("NFKD", title)
+    title = "".join(char for char in title if not unicodedata.combining(char)).casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", title).split())
+
+
+def fixture_key(url):
+    """Nom du fichier d'enregistrement d'une requête : indépendant de l'hôte, de la clé d'API et de l'adresse courriel"""
+    parts = urlsplit(url)
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if k not in ("api_key", "mailto")])
+    return hashlib.sha1(f"{parts.path}?{query}".encode()).hexdigest() + ".json"
+
+
+class RecordingTransport(HTTPAdapter):
+    """Adaptateur requests qui accède au réseau et enregistre chaque réponse OpenAlex réussie dans un répertoire"""
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            # Le corps est lu en entier pour être enregistré ; requests le resservira ensuite depuis la mémoire
+            path = os.path.join(self.directory, fixture_key(request.url))
+            with open(path + ".tmp", "wb") as file:
+                file.write(response.content)
+            os.replace(path + ".tmp", path)
+        return response
+
+
+class ReplayTransport(BaseAdapter):
+    """Adaptateur requests qui sert les réponses enregistrées par RecordingTransport, sans accès au réseau"""
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+
+    def load(self, url):
+        """Corps enregistré pour l'url, None s'il est absent"""
+        try:
+            with open(os.path.join(self.directory, fixture_key(url)), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def send(self, request, **kwargs):
+        body = self.load(request.url)
+        response = requests.Response()
+        response.status_code = 200 if body is not None else 404
+        response.reason = "OK" if body is not None else "Not Found (absent des enregistrements)"
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        response.raw = io.BytesIO(body or b"{}")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
         pass
+
+
+class MyApi():
+    # Statuts HTTP pour lesquels la requête est retentée
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    # Opérations exécutables ensemble par run_reports
+    OPERATIONS = ("works", "collaborators", "report", "topics", "partners", "trends", "all")
+
+    # Champs OpenAlex utilisés pour les décomptes côté serveur (group_by) et champs à lire en cas de repli
+    GROUP_BY_FIELDS = {
+        "countries": ("authorships.institutions.country_code", "id,authorships"),
+        "topics": ("topics.id", "id,topics"),
+        "years": ("publication_year", "id,publication_year"),
+        "institutions": ("authorships.institutions.id", "id,authorships"),
+    }
+
+    # Nombre maximal d'index de collaboration conservés en mémoire (les plus anciennement utilisés sont oubliés)
+    INDEX_CACHE_SIZE = 4
+
+    def __init__(self, cache_path="openalex_cache.sqlite", api_key=None, max_workers=4,
+                 mailto=None, timeout=(10, 60), max_retries=5, backoff_factor=1.0,
+                 output_dir=".", export_formats=("xlsx",), institution_rors=("https://ror.org/0020snb74",),
+                 transport=None, base_url="https://api.openalex.org/", chart_format="png", chart_dpi=100, metrics=None,
+                 cache_max_age=1):
+        self.url = base_url
+        # Institutions analysées (ROR complets) ; la première est l'institution de référence des rapports
+        self.institution_rors = tuple(f"https://ror.org/{short_ror(ror)}" for ror in institution_rors)
+        self.institution_ror = short_ror(self.institution_rors[0])
+        # Cache local des publications (désactivé si cache_path vaut None)
+        # Décodage des pages en publications projetées, partagé avec le cache
+        self.parser = WorkParser()
+        self.cache = WorkCache(cache_path, self.parser) if cache_path else None
+        # Le filtre from_updated_date est réservé aux clés d'API OpenAlex
+        self.api_key = api_key
+        # Une année synchronisée depuis moins de cache_max_age jours est lue depuis le cache (sans clé d'API) ou mise à
+        # jour par from_updated_date (avec une clé) ; au-delà, elle est retéléchargée entièrement
+        self.cache_max_age = cache_max_age
+        # Nombre maximal d'années téléchargées simultanément
+        self.max_workers = max_workers
+        # Adresse courriel pour le "polite pool" d'OpenAlex
+        self.mailto = mailto
+        # Délais (connexion, lecture) en secondes et politique de nouvelles tentatives
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        # Mesures d'exécution (requêtes, cache, durée des étapes), partagées avec les copies de with_output_dir
+        self.metrics = metrics or Metrics()
+        # Répertoire et formats des fichiers produits
+        self.exporter = Exporter(output_dir, export_formats, self.metrics)
+        # Format (png ou svg) et résolution des graphiques enregistrés
+        self.chart_format = chart_format
+        self.chart_dpi = chart_dpi
+        # Index de collaboration déjà construits, par (institution, année de début, année de fin) : (état du cache lors de
+        # la construction, index), réutilisés tant que cet état n'a pas changé (voir __sync_state) ; au plus
+        # INDEX_CACHE_SIZE, partagés avec les copies de with_output_dir
+        self.collaboration_indexes = OrderedDict()
+        self.__indexes_lock = threading.Lock()
+
+        # Réponses en cours de lecture, associées à la fonction d'interruption de l'opération qui les a demandées
+        self.__in_flight = {}
+        self.__in_flight_lock = threading.Lock()
+
+        # Session HTTP persistante : les connexions (et la négociation TLS) sont réutilisées entre les pages. Les requêtes
+        # simultanées de tous les traitements (fils de téléchargement, tâches de l'interface, copies de with_output_dir)
+        # sont limitées à max_workers : le groupe de connexions n'est jamais dépassé
+        self.__request_slots = threading.BoundedSemaphore(max_workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Transport de remplacement (enregistrement, rejeu hors ligne, corpus synthétique) pour l'API OpenAlex
+        if transport is not None:
+            self.session.mount(self.url, transport)
     
     
-    def show_works(self, start_year, end_year=None, check_interrupt=None):
+    def show_works(self, start_year, end_year=None, check_interrupt=None, progress=None):
         """Méthode pour regrouper les publications attribuables à une institution donnée sur une période donnée"""
-        url = self.__url_works_generator(start_year, end_year)
-        results = self.__extract_data(url, check_interrupt)
-        self.__generate_excel_file(results)
+        publications = PublicationAggregator(self.institution_rors)
+        self.__consume(start_year, end_year, [publications], check_interrupt, progress)
+        self.__generate_excel_file(publications.rows)
         return
     
-    def show_collaborators(self, start_year, end_year=None, check_interrupt=None):
+    def show_collaborators(self, start_year, end_year=None, check_interrupt=None, per_work=False, progress=None):
         """Méthode pour programmer l’extraction de la liste des pays collaborateurs pour la période."""
-        country_counts = self.__extract_collaborators(start_year, end_year, check_interrupt)
-        self.__collaborators_excel_file(country_counts)
+        country_counts = self.__country_counts(start_year, end_year, check_interrupt, per_work, progress)
+        self.__collaborators_excel_file(country_counts, per_work)
         pass
     
     
-    def generate_country_report(self, start_year, end_year=None, check_interrupt=None):
+    def generate_country_report(self, start_year, end_year=None, check_interrupt=None, per_work=False, progress=None):
         """Méthode pour générer le document word contenant le graphique représentant les 10 principaux pays collaborateurs"""
-        country_counts = self.__extract_collaborators(start_year, end_year, check_interrupt)
-        self.__generate_graph(country_counts)
-        self.__insert_into_word(start_year, end_year)
-        
+        country_counts = self.__country_counts(start_year, end_year, check_interrupt, per_work, progress)
+        image = self.__generate_graph(country_counts)
+        self.__insert_into_word(start_year, end_year, image)
         
-    def show_works_with_collaboration(self, collaborator_ror, start_year, end_year=None, check_interrupt=None):
-        """Méthode pour programmer l’extraction de la liste des principaux sujets des publications en collaboration entre l’ÉTS et le CNRS"""
-        target_rors = {
-            "https://ror.org/0020snb74",
-            f"{collaborator_ror}"
-        }
         
-        url = self.__url_works_generator(start_year, end_year)
-        results = self.__extract_data(url, check_interrupt)
-        
-        # Premier filtrage pour obtenir uniquement les données associées aux ROR qui nous intéressent
-        new_data = [
-            work for work in results 
-            if target_rors.issubset(
-                {institution.get("ror") 
-                for authorship in work.get("authorships", []) 
-                for institution in authorship.get("institutions", [])
-                if institution.get("ror")}
-            )
-        ]
-        
-        topics_list = []
+    def generate_all_reports(self, collaborator_ror, start_year, end_year=None, check_interrupt=None, per_work=False, progress=None):
+        """Méthode pour générer tous les livrables (publications, pays, rapport word, sujets) à partir d'un seul téléchargement"""
+        self.run_reports(start_year, end_year, [("all", collaborator_ror)], check_interrupt, per_work, progress)
+        return
+    
+    def run_reports(self, start_year, end_year=None, operations=(), check_interrupt=None, per_work=False, progress=None,
+                    table=None):
+        """Exécute plusieurs opérations sur la même période à partir d'un seul téléchargement
 
-        # Extraire les pays des institutions des co-auteurs
-        for pub in new_data:
-            for topic in pub.get("topics", []):
-                topics_list.append(topic.get("display_name"))
+        operations : liste de (opération, ROR collaborateur ou None), avec opération parmi MyApi.OPERATIONS.
+        per_work : pays comptés une fois par publication plutôt qu'à chaque institution des co-auteurs.
+        table : WorkTable de la période déjà construite (téléchargement partagé), utilisée à la place d'un téléchargement.
 
-        # Compter le nombre d'apparitions de chaque pays
-        topic_counts = Counter(topics_list)
-        """Ensuite, faisons l'extraction sous forme d'un graphe"""
+        Tous les décomptes portent sur les publications de iter_works, doublons écartés : ils sont identiques qu'ils soient
+        calculés sur la table ou au fil du téléchargement.
+        """
+        requested = self.__expand_operations(operations)
+        names = {operation for operation, _ in requested}
+        topic_rors = list(dict.fromkeys(short_ror(ror) for operation, ror in requested if operation == "topics"))
+        tracker = progress if isinstance(progress, ProgressTracker) else ProgressTracker(progress)
+        count_countries = bool(names & {"collaborators", "report"})
+
+        # La liste des publications et l'index de collaboration s'appuient sur la table de la période
+        if table is None and names & {"works", "partners"}:
+            table = self.build_work_table(start_year, end_year, check_interrupt, tracker, partners="partners" in names)
+
+        if table is not None:
+            # Publications déjà téléchargées : décomptes locaux
+            country_counts = table.country_counts(per_work=per_work) if count_countries else None
+            topic_counts = {ror: table.topic_counts({f"https://ror.org/{self.institution_ror}", f"https://ror.org/{ror}"})
+                            for ror in topic_rors}
+        else:
+            # Un seul passage sur les publications, transmises à tous les agrégateurs nécessaires, sans les conserver
+            countries = CountryAggregator(per_work) if count_countries else None
+            topics = self.__topic_aggregators(topic_rors)
+            aggregators = ([countries] if countries else []) + list(topics.values())
+            if aggregators:
+                self.__consume(start_year, end_year, aggregators, check_interrupt, tracker)
+            country_counts = countries.counts if countries else None
+            topic_counts = {ror: aggregator.counts for ror, aggregator in topics.items()}
+
+        if "works" in names:
+            self.__generate_excel_file(table.publications())
+        if "collaborators" in names:
+            self.__collaborators_excel_file(country_counts, per_work)
+        if "report" in names:
+            image = self.__generate_graph(country_counts)
+            self.__insert_into_word(start_year, end_year, image)
+        if "partners" in names:
+            self.show_top_partners(start_year, end_year, index=table.collaboration_index)
+        topic_charts = []
+        for ror in topic_rors:
+            # Un graphique par collaborateur lorsque plusieurs sont analysés ensemble
+            topic_charts.append((self.__topics_chart(topic_counts[ror]), "top_topics" if len(topic_rors) == 1 else f"top_topics_{ror}"))
+        # Les tendances s'appuient sur les décomptes annuels enregistrés, pas sur le téléchargement commun
+        trends = [self.__trend(start_year, end_year, ror, check_interrupt, tracker)
+                  for ror in dict.fromkeys(ror for operation, ror in requested if operation == "trends")]
+        charts = topic_charts + [chart for trend in trends for chart in trend["charts"]]
+        if charts:
+            # Graphiques de tous les collaborateurs et de toutes les tendances rendus ensemble (groupe de processus au-delà
+            # de quelques graphiques)
+            images = self.__save_charts(charts)
+            self.__write_trend_reports(trends, images[len(topic_charts):])
+        return
+    
+    def with_output_dir(self, output_dir):
+        """Copie de l'instance écrivant dans un autre répertoire (session, cache et index partagés)"""
+        clone = copy.copy(self)
+        clone.exporter = Exporter(output_dir, self.exporter.formats, self.metrics)
+        return clone
+    
+    def needs_work_table(self, operations):
+        """True si les opérations (liste de (opération, ROR)) s'appuient sur le téléchargement complet de la période
+
+        Seules les tendances (décomptes annuels enregistrés) n'en ont pas besoin : une WorkTable déjà construite peut être
+        transmise à run_reports pour toutes les autres.
+        """
+        names = {operation for operation, _ in self.__expand_operations(operations)}
+        return bool(names - {"trends"})
+
+    def needs_collaboration_index(self, operations):
+        """True si les opérations (liste de (opération, ROR)) utilisent l'index de collaboration (build_work_table partners)"""
+        return any(operation == "partners" for operation, _ in self.__expand_operations(operations))
+
+    def build_work_table(self, start_year, end_year=None, check_interrupt=None, progress=None, partners=False):
+        """Télécharge la période et la normalise en tables en colonnes (WorkTable) pour les analyses croisées
+
+        partners : l'index de collaboration de la période est construit pendant le même passage (table.collaboration_index).
+        """
+        table = WorkTable(self.institution_rors)
+        aggregators = [table]
+        if partners:
+            table.collaboration_index = CollaborationIndex(f"https://ror.org/{self.institution_ror}")
+            aggregators.append(table.collaboration_index)
+        self.__consume(start_year, end_year, aggregators, check_interrupt, progress)
+        if partners:
+            self.__store_index(start_year, end_year, table.collaboration_index)
+        return table
+    
+    def compare_institutions(self, start_year, end_year=None, institution_rors=None, check_interrupt=None, progress=None):
+        """Méthode pour comparer côte à côte les pays et sujets de plusieurs institutions sur la période"""
+        rors = [f"https://ror.org/{short_ror(ror)}" for ror in (institution_rors or self.institution_rors)]
+        table = WorkTable(self.institution_rors)
+        # Un seul index de doublons pour toutes les institutions : une publication commune (même identifiant, DOI ou titre)
+        # n'est ajoutée qu'une fois
+        deduplicator = WorkDeduplicator(self.metrics)
+        lock = threading.Lock()
+        # Un seul suivi d'avancement pour toutes les institutions
+        tracker = progress if isinstance(progress, ProgressTracker) else ProgressTracker(progress)
+        # Au plus max_workers requêtes simultanées au total (voir __acquire_request_slot)
+        institutions = min(len(rors), self.max_workers)
+        workers = max(1, self.max_workers // institutions)
+
+        def fetch(ror):
+            for work in self.iter_works(start_year, end_year, check_interrupt, institution_ror=ror, progress=tracker,
+                                        dedupe=False, max_workers=workers):
+                with lock:
+                    if deduplicator.add(work):
+                        table.add(work)
+
+        # Une extraction par institution, en parallèle, toutes partageant le cache local
+        with self.metrics.stage("fetch"), ThreadPoolExecutor(max_workers=institutions) as executor:
+            for future in [executor.submit(fetch, ror) for ror in rors]:
+                future.result()
+
+        labels = {ror: short_ror(ror) for ror in rors}
+        countries = pd.DataFrame({
+            labels[ror]: pd.Series(table.country_counts(per_work=True, required_rors={ror}), dtype="int64") for ror in rors
+        }).fillna(0).astype(int)
+        topics = pd.DataFrame({
+            labels[ror]: pd.Series(table.topic_counts(required_rors={ror}), dtype="int64") for ror in rors
+        }).fillna(0).astype(int)
+        countries = countries.sort_values(by=labels[rors[0]], ascending=False)
+        topics = topics.sort_values(by=labels[rors[0]], ascending=False)
+
+        paths = self.exporter.export(countries.rename_axis("Pays").reset_index(), "comparaison_pays")
+        paths += self.exporter.export(topics.rename_axis("Sujet").reset_index(), "comparaison_sujets")
+        logger.info(f"✅ Comparaison de {len(rors)} institutions ({len(table.table('works'))} publications distinctes) enregistrée dans {', '.join(repr(path) for path in paths)}.")
+        return countries, topics
+    
+    def iter_works(self, start_year, end_year=None, check_interrupt=None, institution_ror=None, progress=None, dedupe=True,
+                   max_workers=None):
+        """Générateur des publications de la période (institution de référence par défaut), produites page par page au fil du téléchargement
+
+        Les années sont téléchargées en parallèle mais produites dans l'ordre chronologique, chacune dans l'ordre de ses pages.
+        progress : fonction appelée avec l'avancement (pages, publications, total, débit, temps restant), ou ProgressTracker partagé.
+        dedupe : les autres versions d'une publication déjà produite (même DOI, ou même titre la même année) sont écartées.
+        max_workers : nombre maximal d'années téléchargées simultanément (self.max_workers par défaut).
+        """
+        max_workers = max_workers or self.max_workers
+        # Validation de la période
+        self.__generate_publication_year_filter(start_year, end_year)
+        last_year = start_year if end_year is None else end_year
+        years = range(start_year, last_year + 1)
+
+        # Une file bornée par année, vidée dans l'ordre des années : les années suivantes prennent au plus quelques pages
+        # d'avance, la mémoire reste limitée quel que soit la durée de la période
+        pages = {year: queue.Queue(maxsize=2 * max_workers) for year in years}
+        stop = threading.Event()
+
+        tracker = progress if isinstance(progress, ProgressTracker) else ProgressTracker(progress)
+        # Les pages sont consommées par un seul fil : les index de doublons ne sont pas partagés
+        deduplicator = WorkDeduplicator(self.metrics) if dedupe else None
+
+        def interrupted():
+            return stop.is_set() or bool(check_interrupt and check_interrupt())
+        # Permet à abort() de retrouver les requêtes de cette opération
+        interrupted.owner = check_interrupt
+
+        def put(year, item):
+            while not stop.is_set():
+                try:
+                    pages[year].put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def produce(year):
+            try:
+                for page in self.__iter_year_pages(year, interrupted, institution_ror, tracker):
+                    put(year, page)
+            except BaseException as e:
+                put(year, _WorkerError(e))
+            finally:
+                put(year, _YEAR_DONE)
+
+        # Les années sont lancées dans l'ordre : l'année attendue par le consommateur est toujours en cours ou terminée
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(years))))
+        for year in years:
+            executor.submit(produce, year)
+
+        total = 0
         try:
-            self.__generate_graph_topics(topic_counts)
-        except ValueError as e:
-            raise ValueError(e)
+            for year in years:
+                while True:
+                    item = pages[year].get()
+                    if item is _YEAR_DONE:
+                        break
+                    if isinstance(item, _WorkerError):
+                        raise item.error
+                    # L'avancement porte sur les résultats reçus, doublons compris (total annoncé par OpenAlex)
+                    tracker.advance(len(item))
+                    if deduplicator is not None:
+                        item = [work for work in item if deduplicator.add(work)]
+                    total += len(item)
+                    yield from item
+        finally:
+            # Arrêt des téléchargements restants (fin normale, erreur, interruption ou abandon du générateur)
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        duplicates = sum(deduplicator.duplicates.values()) if deduplicator is not None else 0
+        logger.info(f"Nombre total de publications récupérées : {total}" + (f" ({duplicates} doublon(s) écarté(s))" if duplicates else ""),
+                    extra={"event": "works_fetched", "records": total, "duplicates": duplicates})
+    
+    def aggregate(self, dimension, start_year, end_year=None, collaborator_ror=None, check_interrupt=None, progress=None):
+        """Nombre de notices par pays, sujet, année ou institution, calculé par OpenAlex (group_by)
+
+        Décompte approximatif : chaque notice OpenAlex compte, y compris les autres versions d'une même publication
+        (prépublication, version publiée) que WorkDeduplicator écarte. Les rapports ne l'utilisent pas : ils comptent les
+        publications de iter_works, chacune une seule fois.
+        """
+        if dimension not in self.GROUP_BY_FIELDS:
+            raise ValueError(f"Dimension inconnue : {dimension} (valeurs possibles : {', '.join(self.GROUP_BY_FIELDS)})")
+        group_by, select = self.GROUP_BY_FIELDS[dimension]
+        tracker = progress if isinstance(progress, ProgressTracker) else ProgressTracker(progress)
+
+        try:
+            # Seuls les décomptes sont renvoyés, sans aucune publication
+            url = self.__url_works_generator(start_year, end_year, collaborator_ror=collaborator_ror, group_by=group_by)
+            counts = Counter()
+            with self.metrics.stage("group_by"):
+                for group in self.__extract_groups(url, check_interrupt, tracker):
+                    counts[self.__group_label(dimension, group)] += group["count"]
+            return counts
+        except ApiError as e:
+            # Erreurs serveur et quotas épuisés : un parcours complet avec les mêmes filtres échouerait de la même façon
+            if not 400 <= e.status < 500 or e.status == 429:
+                raise
+            # Un ROR invalide est aussi refusé sans group_by : seul un refus du regroupement justifie le repli
+            self.__check_filters(start_year, end_year, collaborator_ror, check_interrupt)
+            logger.warning(f"⚠️ Regroupement côté serveur indisponible ({e}), parcours des publications", extra={"event": "group_by_fallback"})
+
+        # Repli : parcours des publications, limitées aux champs utiles, avec la même sémantique (une fois par publication)
+        counts = Counter()
+        url = self.__url_works_generator(start_year, end_year, collaborator_ror=collaborator_ror, select=select)
+        with self.metrics.stage("fetch"):
+            for page in self.__extract_data(url, check_interrupt, tracker):
+                tracker.advance(len(page))
+                for work in page:
+                    counts.update(self.__work_keys(dimension, work))
+        return counts
+    
+    def build_collaboration_index(self, start_year, end_year=None, check_interrupt=None, progress=None):
+        """Index des co-publications de l'institution de référence, reconstruit si le cache de la période a changé"""
+        index = self.__cached_index(start_year, end_year)
+        if index is None:
+            index = CollaborationIndex(f"https://ror.org/{self.institution_ror}")
+            self.__consume(start_year, end_year, [index], check_interrupt, progress)
+            self.__store_index(start_year, end_year, index)
+        return index
+    
+    def show_top_partners(self, start_year, end_year=None, k=20, check_interrupt=None, progress=None, index=None):
+        """Méthode pour lister les k principaux partenaires de l'institution et exporter le graphe de collaboration
+
+        index : CollaborationIndex de la période déjà construit (WorkTable.collaboration_index), sinon construit ici.
+        """
+        if index is None:
+            index = self.build_collaboration_index(start_year, end_year, check_interrupt, progress)
+        df = pd.DataFrame(index.top_partners(k), columns=["ROR", "Institution", "Pays", "Nombre de publications"])
+
+        paths = self.exporter.export(df, "principaux_partenaires")
+        with self.metrics.stage("export"):
+            index.write_graphml(self.exporter.path("collaborations.graphml"))
+            index.write_edge_list(self.exporter.path("collaborations_aretes.csv"))
+        paths += [self.exporter.path("collaborations.graphml"), self.exporter.path("collaborations_aretes.csv")]
+        logger.info(f"✅ {len(df)} principaux partenaires enregistrés dans {', '.join(repr(path) for path in paths)}.")
+        return df
+    
+    def abort(self, check_interrupt=None):
+        """Interrompt immédiatement les téléchargements en cours (ceux de l'opération donnée, ou tous)
+
+        À appeler après avoir demandé l'arrêt à check_interrupt : la lecture de la réponse fermée s'arrête sur l'interruption.
+        """
+        with self.__in_flight_lock:
+            responses = [
+                response for response, owner in self.__in_flight.items()
+                if check_interrupt is None or owner == check_interrupt
+            ]
+        for response in responses:
+            # Fermer la réponse attendrait la fin de la lecture en cours : on coupe directement la connexion
+            sock = self.__response_socket(response)
+            try:
+                if sock is not None:
+                    sock.shutdown(socket.SHUT_RDWR)
+                else:
+                    response.close()
+            except OSError:
+                pass  # Connexion déjà fermée
+    
+    def show_works_with_collaboration(self, collaborator_ror, start_year, end_year=None, check_interrupt=None, progress=None):
+        """Méthode pour programmer l’extraction de la liste des principaux sujets des publications en collaboration entre l’ÉTS et le CNRS"""
+        index = self.__cached_index(start_year, end_year)
+        if index is not None:
+            # Index construit sur les mêmes publications du cache : réponse immédiate, sans appel à l'API
+            self.metrics.inc("cache_hits_total", kind="index")
+            topic_counts = index.partner_topics(collaborator_ror)
+        else:
+            # Sujets comptés au fil du téléchargement, sur les mêmes publications (doublons écartés) que les autres rapports
+            topics = self.__topic_aggregators([short_ror(collaborator_ror)])
+            self.__consume(start_year, end_year, list(topics.values()), check_interrupt, progress)
+            topic_counts = next(iter(topics.values())).counts
+        """Ensuite, faisons l'extraction sous forme d'un graphe"""
+        self.__save_charts([(self.__topics_chart(topic_counts), "top_topics")])
         return
     
+    def yearly_counts(self, start_year, end_year=None, collaborator_ror=None, check_interrupt=None, progress=None):
+        """Décomptes par année {année: {"publications", "countries", "topics"}}, limités aux co-publications si collaborator_ror
+
+        Les décomptes de chaque année sont enregistrés dans le cache local. Ils ne sont réutilisés que s'ils ont été calculés
+        depuis la dernière synchronisation de l'année et que celle-ci n'est pas à renouveler (cache_max_age) : sinon
+        l'année est de nouveau synchronisée et ses décomptes recalculés, comme les années absentes ou encore en cours.
+        """
+        end_year = end_year or start_year
+        collaborator = short_ror(collaborator_ror) if collaborator_ror else None
+        current_year = datetime.now(timezone.utc).year
+        partitions = {}
+        missing = []
+        for year in range(start_year, end_year + 1):
+            partition = None
+            if self.cache is not None and year < current_year:
+                partition = self.__load_partition(collaborator, year)
+            if partition is None:
+                missing.append(year)
+            else:
+                partitions[year] = partition
+        if partitions:
+            self.metrics.inc("cache_hits_total", len(partitions), kind="partitions")
+            logger.info(f"♻️ {len(partitions)} année(s) lue(s) depuis les décomptes enregistrés",
+                        extra={"event": "cache_hit", "kind": "partitions", "years": sorted(partitions)})
+
+        required_rors = {f"https://ror.org/{self.institution_ror}", f"https://ror.org/{collaborator}"} if collaborator else None
+        # Les années manquantes consécutives sont téléchargées ensemble (une année par fil)
+        for first, last in self.__year_runs(missing):
+            aggregator = YearlyAggregator(required_rors)
+            self.__consume(first, last, [aggregator], check_interrupt, progress)
+            # Des décomptes partiels ne doivent jamais être enregistrés
+            self.__check_cancelled(check_interrupt)
+            for year in range(first, last + 1):
+                partitions[year] = aggregator.partitions.get(year) or YearlyAggregator.empty_partition()
+                if self.cache is not None and year < current_year:
+                    self.cache.store_partition(self.institution_ror, collaborator, year, partitions[year])
+        return partitions
+    
+    def generate_trend_report(self, start_year, end_year=None, collaborator_ror=None, check_interrupt=None, progress=None, top=5):
+        """Méthode pour générer le rapport word de l'évolution annuelle des publications, des pays et des sujets"""
+        trend = self.__trend(start_year, end_year, collaborator_ror, check_interrupt, progress, top)
+        self.__write_trend_reports([trend], self.__save_charts(trend["charts"]))
+
+    # Étapes des rapports, utilisables séparément (mesures de benchmark.py)
+
+    def count_countries(self, start_year, end_year=None, check_interrupt=None, per_work=False, progress=None):
+        """Pays collaborateurs de la période (Counter) : chaque institution compte, ou une fois par publication si per_work"""
+        return self.__country_counts(start_year, end_year, check_interrupt, per_work, progress)
+
+    def write_publications(self, publications_data):
+        """Enregistre la liste des publications (lignes de PublicationAggregator ou WorkTable.publications())"""
+        self.__generate_excel_file(publications_data)
+
+    def write_countries_chart(self, country_counts):
+        """Enregistre le graphique des 10 principaux pays ; renvoie l'image PNG destinée au rapport Word"""
+        return self.__generate_graph(country_counts)
+
+    def write_topics_chart(self, topic_counts, name="top_topics"):
+        """Enregistre le graphique des 20 principaux sujets ; renvoie l'image produite"""
+        return self.__save_charts([(self.__topics_chart(topic_counts), name)])[0]
+
+    def write_country_report(self, start_year, end_year=None, image=None):
+        """Enregistre le rapport Word des pays collaborateurs à partir de l'image de write_countries_chart"""
+        self.__insert_into_word(start_year, end_year, image)
+    
 
         
 
@@ -81,34 +1545,241 @@ class MyApi():
 # ******************************************************************************************************************
 
 
-    def __url_works_generator(self, start_year, end_year=None):
+    def __url_works_generator(self, start_year, end_year=None, updated_since=None, collaborator_ror=None,
+                              select="id,updated_date,display_name,publication_year,doi,authorships,topics", group_by=None,
+                              institution_ror=None):
         """Génération de l'url qui sera utilisée pour l'appel d'api"""
         publication_year = self.__generate_publication_year_filter(start_year, end_year)
-        url= self.url + f'works?filter=authorships.institutions.ror:0020snb74,publication_year:{publication_year}&select=display_name,publication_year,doi,authorships,topics'
-        return url
+        institution = short_ror(institution_ror) if institution_ror else self.institution_ror
+        filters = f"authorships.institutions.ror:{institution},publication_year:{publication_year}"
+        if collaborator_ror:
+            # Deux filtres sur le même champ se combinent en ET : publications co-signées uniquement
+            filters += f",authorships.institutions.ror:{short_ror(collaborator_ror)}"
+        if updated_since:
+            filters += f",from_updated_date:{updated_since}"
+        # select n'est pas accepté par OpenAlex avec group_by
+        params = {"filter": filters, **({"group_by": group_by} if group_by else {"select": select})}
+        if self.api_key:
+            params["api_key"] = self.api_key
+        if self.mailto:
+            params["mailto"] = self.mailto
+        # Valeurs encodées (me+tag@x.org) ; les séparateurs des filtres restent lisibles
+        return self.url + "works?" + urlencode(params, safe=":,|")
     
-    def __extract_data(self, url, check_interrupt=None):
-        """Extraction des données à partir de l'url générée"""
-        all_results = []
-        cursor = "*"  # Premier curseur pour la pagination
+    def __check_filters(self, start_year, end_year=None, collaborator_ror=None, check_interrupt=None):
+        """Vérifie, par une requête d'une seule publication, que les filtres (ROR) sont acceptés par OpenAlex"""
+        url = self.__url_works_generator(start_year, end_year, collaborator_ror=collaborator_ror, select="id")
+        try:
+            self.__get_page(f"{url}&per-page=1", check_interrupt)
+        except ApiError as e:
+            if 400 <= e.status < 500 and e.status != 429:
+                raise ValueError("ROR INVALIDE") from e
+            raise
 
-        while cursor and not (check_interrupt and check_interrupt()):
-            paginated_url = f"{url}&per-page=200&cursor={cursor}"
-            response = requests.get(paginated_url)
+    def __expand_operations(self, operations):
+        """Valide les opérations et remplace "all" par les opérations qu'elle regroupe"""
+        requested = []
+        for operation, ror in operations:
+            if operation not in self.OPERATIONS:
+                raise ValueError(f"Opération inconnue : {operation}")
+            if operation in ("topics", "all") and not ror:
+                raise ValueError("ROR collaborateur requis")
+            if operation == "all":
+                requested += [("works", None), ("collaborators", None), ("report", None), ("topics", ror)]
+            else:
+                requested.append((operation, ror))
+        return requested
+
+    def __country_counts(self, start_year, end_year=None, check_interrupt=None, per_work=False, progress=None):
+        """Pays collaborateurs : chaque institution d'un pays compte, y compris plusieurs fois pour une même publication
+        (rapport d'origine), ou chaque pays une fois par publication si per_work=True"""
+        return self.__extract_collaborators(start_year, end_year, check_interrupt, progress, per_work)
+    
+    def __topic_aggregators(self, collaborator_rors):
+        """Un agrégateur des sujets des co-publications par collaborateur (ROR courts) : {ROR: TopicAggregator}"""
+        return {ror: TopicAggregator({f"https://ror.org/{self.institution_ror}", f"https://ror.org/{ror}"})
+                for ror in collaborator_rors}
+    
+    def __group_label(self, dimension, group):
+        """Libellé d'un groupe renvoyé par group_by, dans le format des décomptes locaux"""
+        if dimension == "countries":
+            # La clé peut être le code seul (CA) ou une URL (https://openalex.org/countries/CA)
+            return group["key"].rsplit("/", 1)[-1].upper()
+        if dimension == "years":
+            return int(group["key"])
+        return group.get("key_display_name") or group["key"]
+    
+    def __work_keys(self, dimension, work):
+        """Valeurs distinctes d'une publication pour une dimension (repli du décompte côté serveur)"""
+        institutions = work.institutions()
+        if dimension == "countries":
+            return {institution.country_code for institution in institutions if institution.country_code}
+        if dimension == "topics":
+            return set(work.topics)
+        if dimension == "years":
+            return {work.publication_year}
+        return {institution.display_name or institution.id for institution in institutions if institution.id}
+    
+    def __extract_groups(self, url, check_interrupt=None, progress=None):
+        """Extraction de tous les groupes (clé, libellé, nombre) d'une requête group_by, page par page"""
+        groups = []
+        cursor = "*"
 
-            if response.status_code != 200:
-                print("❌ Erreur lors de la récupération des données:", response.status_code)
+        while cursor and not (check_interrupt and check_interrupt()):
+            data = self.__get_page(f"{url}&per-page=200&cursor={cursor}", check_interrupt)
+            page = data.get("group_by", [])
+            if not page:
                 break
+            self.metrics.inc("pages_total")
+            groups.extend(page)
+            if progress:
+                progress.advance(len(page))
+            cursor = data.get("meta", {}).get("next_cursor")
+
+        return groups
+    
+    def __consume(self, start_year, end_year, aggregators, check_interrupt=None, progress=None):
+        """Transmet chaque publication téléchargée à tous les agrégateurs, en un seul passage"""
+        with self.metrics.stage("fetch"):
+            for work in self.iter_works(start_year, end_year, check_interrupt, progress=progress):
+                for aggregator in aggregators:
+                    aggregator.add(work)
+    
+    def __iter_year_pages(self, year, interrupted, institution_ror=None, tracker=None):
+        """Pages d'une année : synchronisation avec OpenAlex puis lecture depuis le cache
+
+        Une année synchronisée depuis moins de cache_max_age jours est lue depuis le cache sans requête (sans clé d'API,
+        le filtre from_updated_date est refusé) ou après une mise à jour incrémentale (avec une clé). Une année plus
+        ancienne est retéléchargée entièrement : les publications retirées ou fusionnées par OpenAlex sont détachées.
+        """
+        if self.cache is None:
+            url = self.__url_works_generator(year, institution_ror=institution_ror)
+            yield from self.__extract_data(url, interrupted, tracker)
+            return
+
+        institution = short_ror(institution_ror) if institution_ror else self.institution_ror
+        query_key = f"{institution}:{year}"
+        last_sync = self.cache.last_sync(query_key)
+        sync_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        if last_sync and self.__sync_age(last_sync) >= self.cache_max_age:
+            # Synchronisation trop ancienne : les publications retirées d'OpenAlex ne doivent pas rester rattachées
+            self.cache.reset(query_key)
+            last_sync = None
+        elif last_sync and not self.api_key:
+            logger.info(f"♻️ {year} : lu depuis le cache (synchronisé le {last_sync})",
+                        extra={"event": "cache_sync", "year": year, "updated": 0, "last_sync": last_sync})
+            yield from self.__iter_cached_pages(institution, year, tracker)
+            return
+
+        url = self.__url_works_generator(year, updated_since=last_sync, institution_ror=institution_ror)
+        updated = 0
+        # Le total annoncé n'est pertinent que pour un premier téléchargement complet
+        for page in self.__extract_data(url, interrupted, None if last_sync else tracker):
+            self.cache.store(query_key, page)
+            updated += len(page)
+            # Premier téléchargement de l'année : les pages sont transmises dès leur réception
+            if not last_sync:
+                yield page
+
+        # Les décomptes annuels enregistrés ne correspondent plus aux publications de l'année
+        if updated:
+            self.cache.invalidate_partitions(institution, year)
+
+        # On ne marque l'année comme synchronisée que si l'extraction n'a pas été interrompue
+        if interrupted():
+            return
+        self.cache.mark_synced(query_key, sync_date)
+
+        if last_sync:
+            logger.info(f"♻️ {year} : {updated} publication(s) mise(s) à jour depuis le {last_sync}",
+                        extra={"event": "cache_sync", "year": year, "updated": updated, "last_sync": last_sync})
+            yield from self.__iter_cached_pages(institution, year, tracker)
+
+    def __sync_state(self, start_year, end_year=None):
+        """État du cache pour les années d'une période : (date de synchronisation, version) de chaque année
+
+        None sans cache local, ou si une année n'est pas synchronisée ou doit être retéléchargée : les publications
+        servies par iter_works peuvent alors changer.
+        """
+        if self.cache is None:
+            return None
+        state = []
+        for year in range(start_year, (end_year or start_year) + 1):
+            query_key = f"{self.institution_ror}:{year}"
+            last_sync = self.cache.last_sync(query_key)
+            if not last_sync or self.__sync_age(last_sync) >= self.cache_max_age:
+                return None
+            state.append((last_sync, self.cache.version(query_key)))
+        return tuple(state)
 
-            data = response.json()
-            publications = data.get("results", [])
+    def __store_index(self, start_year, end_year, index):
+        """Conserve un index de collaboration avec l'état du cache des publications à partir desquelles il a été construit"""
+        state = self.__sync_state(start_year, end_year)
+        key = (self.institution_ror, start_year, end_year)
+        with self.__indexes_lock:
+            if state is None:
+                # Sans cache local (ou période à resynchroniser), l'index ne pourra jamais être réutilisé
+                self.collaboration_indexes.pop(key, None)
+                return
+            self.collaboration_indexes[key] = (state, index)
+            self.collaboration_indexes.move_to_end(key)
+            while len(self.collaboration_indexes) > self.INDEX_CACHE_SIZE:
+                self.collaboration_indexes.popitem(last=False)
 
-            meta = data.get("meta", {})
+    def __cached_index(self, start_year, end_year=None):
+        """Index de collaboration de la période s'il a été construit sur l'état actuel du cache, sinon None"""
+        key = (self.institution_ror, start_year, end_year)
+        with self.__indexes_lock:
+            state, index = self.collaboration_indexes.get(key, (None, None))
+            if index is not None:
+                self.collaboration_indexes.move_to_end(key)
+        if state is None or state != self.__sync_state(start_year, end_year):
+            return None
+        return index
+
+    def __load_partition(self, collaborator, year):
+        """Décomptes enregistrés d'une année s'ils correspondent aux publications du cache, None sinon"""
+        last_sync = self.cache.last_sync(f"{self.institution_ror}:{year}")
+        # Année à retélécharger : ses publications (et donc ses décomptes) peuvent avoir changé
+        if not last_sync or self.__sync_age(last_sync) >= self.cache_max_age:
+            return None
+        return self.cache.load_partition(self.institution_ror, collaborator, year, computed_since=last_sync)
+
+    def __sync_age(self, last_sync):
+        """Nombre de jours écoulés depuis une synchronisation"""
+        return (datetime.now(timezone.utc).date() - datetime.strptime(last_sync, "%Y-%m-%d").date()).days
+
+    def __iter_cached_pages(self, institution, year, tracker=None):
+        """Pages d'une année lues depuis le cache local"""
+        query_key = f"{institution}:{year}"
+        # Une publication dont l'année a changé (mise à jour reçue avec sa nouvelle année) n'est plus servie ici
+        if self.cache.detach_moved(query_key, year):
+            self.cache.invalidate_partitions(institution, year)
+        if tracker:
+            tracker.add_total(self.cache.count(query_key))
+        for page in self.cache.iter_load(query_key):
+            self.metrics.inc("cache_hits_total", len(page), kind="works")
+            yield page
+    
+    def __extract_data(self, url, check_interrupt=None, tracker=None):
+        """Extraction des données à partir de l'url générée, page par page (publications projetées en WorkRecord)"""
+        cursor = "*"  # Premier curseur pour la pagination
+
+        while cursor and not (check_interrupt and check_interrupt()):
+            paginated_url = f"{url}&per-page=200&cursor={cursor}"
+            meta, publications = self.__get_page(paginated_url, check_interrupt, self.parser.page)
 
             if not publications:
                 break  # Fin de la pagination
+            self.metrics.inc("pages_total")
+            self.metrics.inc("records_total", len(publications))
 
-            all_results.extend(publications)
+            # Nombre total de résultats annoncé par OpenAlex, connu dès la première page
+            if tracker and cursor == "*":
+                tracker.add_total(meta.get("count") or 0)
+
+            yield publications
             cursor = meta.get("next_cursor")  # Mettre à jour le curseur
 
             # Vérification pour ne pas boucler infiniment
@@ -118,39 +1789,217 @@ class MyApi():
             # Vérification en cas d'interruption de l'opération
             if check_interrupt:
                 check_interrupt()
-
-        # Nombre total de publications récupérées
-        print(f"Nombre total de publications récupérées : {len(all_results)}")           
-        return all_results
         
-    def __extract_collaborators(self, start_year, end_year=None, check_interrupt=None):
-        """Méthode privée pour l’extraction de la liste des pays collaborateurs pour la période."""
-        url = self.__url_works_generator(start_year, end_year)
-        publications = self.__extract_data(url, check_interrupt)
-        country_list = []
+    def __get_page(self, url, check_interrupt=None, parse=json_loads):
+        """Télécharge et décode (parse) une page de résultats, avec nouvelles tentatives (429/5xx, erreurs réseau) et délai exponentiel"""
+        for attempt in range(self.max_retries + 1):
+            response = None
+            self.__acquire_request_slot(check_interrupt)
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout, stream=True)
+                with self.__in_flight_lock:
+                    self.__in_flight[response] = getattr(check_interrupt, "owner", check_interrupt)
+                if response.status_code == 200:
+                    body = self.__read_body(response, check_interrupt)
+                    self.__record_request(url, response.status_code, start, len(body), attempt)
+                    decode_start = time.perf_counter()
+                    data = parse(body)
+                    self.metrics.inc("decode_seconds_total", time.perf_counter() - decode_start)
+                    return data
+            except (requests.RequestException, OSError, ValueError) as e:
+                # Une réponse fermée par abort() échoue ici : l'interruption est prioritaire sur la nouvelle tentative
+                self.__check_cancelled(check_interrupt)
+                self.metrics.inc("request_errors_total", error=e.__class__.__name__)
+                if attempt == self.max_retries:
+                    logger.error(f"❌ Erreur réseau ({e.__class__.__name__}) après {attempt + 1} tentative(s)",
+                                 extra={"event": "request_failed", "url": self.__safe_url(url), "error": str(e)})
+                    raise
+                delay = self.__retry_delay(attempt)
+                self.metrics.inc("retries_total", reason="network")
+                logger.warning(f"⚠️ Erreur réseau ({e.__class__.__name__}), nouvelle tentative dans {delay:.1f} s",
+                               extra={"event": "retry", "reason": e.__class__.__name__, "attempt": attempt + 1, "delay": delay})
+            else:
+                self.__record_request(url, response.status_code, start, 0, attempt)
+                if response.status_code not in self.RETRY_STATUSES or attempt == self.max_retries:
+                    logger.error(f"❌ Erreur lors de la récupération des données: {response.status_code}",
+                                 extra={"event": "request_failed", "url": self.__safe_url(url), "status": response.status_code})
+                    # Une extraction incomplète ne doit jamais être renvoyée silencieusement
+                    raise ApiError(f"Erreur lors de la récupération des données: {response.status_code}", response.status_code)
+                delay = self.__retry_delay(attempt, response.headers.get("Retry-After"))
+                self.metrics.inc("retries_total", reason=str(response.status_code))
+                logger.warning(f"⚠️ Statut {response.status_code}, nouvelle tentative dans {delay:.1f} s",
+                               extra={"event": "retry", "reason": str(response.status_code), "attempt": attempt + 1, "delay": delay})
+            finally:
+                if response is not None:
+                    with self.__in_flight_lock:
+                        self.__in_flight.pop(response, None)
+                    response.close()
+                self.__request_slots.release()
+
+            self.__wait(delay, check_interrupt)
+
+    def __acquire_request_slot(self, check_interrupt=None):
+        """Attend qu'une des max_workers connexions de la session se libère, interrompue dès que l'opération est annulée"""
+        while not self.__request_slots.acquire(timeout=0.2):
+            self.__check_cancelled(check_interrupt)
+
+    def __record_request(self, url, status, start, size, attempt):
+        """Mesures et journal (niveau DEBUG) d'une requête terminée"""
+        seconds = time.perf_counter() - start
+        self.metrics.observe_request(seconds, size, status)
+        logger.debug(f"GET {status} {seconds:.3f} s {size} octets", extra={
+            "event": "request", "url": self.__safe_url(url), "status": status, "seconds": round(seconds, 4),
+            "bytes": size, "attempt": attempt + 1,
+        })
+
+    def __safe_url(self, url):
+        """Url sans la clé d'API, pour le journal"""
+        return re.sub(r"(api_key=)[^&]+", r"\1***", url)
 
-        # Extraire les pays des institutions des co-auteurs
-        for pub in publications:
-            for authorship in pub.get("authorships", []):
-                for institution in authorship.get("institutions", []):
-                    country = institution.get("country_code")
-                    if country:  
-                        country_list.append(country)  # Ajouter le pays s'il est présent
+    def __response_socket(self, response):
+        """Socket sous-jacent d'une réponse en flux (urllib3 / http.client), None s'il est introuvable"""
+        for path in (("_connection", "sock"), ("_fp", "fp", "raw", "_sock")):
+            obj = response.raw
+            for attr in path:
+                obj = getattr(obj, attr, None)
+            if obj is not None:
+                return obj
+        return None
 
-        # Compter le nombre d'apparitions de chaque pays
-        country_counts = Counter(country_list)
+    def __read_body(self, response, check_interrupt=None):
+        """Lit le corps de la réponse par morceaux, en vérifiant l'interruption entre chaque morceau"""
+        chunks = []
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            self.__check_cancelled(check_interrupt)
+            chunks.append(chunk)
+        self.__check_cancelled(check_interrupt)
+        return b"".join(chunks)
 
-        return country_counts
+    def __check_cancelled(self, check_interrupt=None):
+        """Lève une exception si l'opération a été interrompue (check_interrupt peut aussi lever sa propre exception)"""
+        if check_interrupt and check_interrupt():
+            raise OperationCancelled("Traitement interrompu")
+
+    def __wait(self, delay, check_interrupt=None):
+        """Attente avant une nouvelle tentative, interrompue dès que l'opération est annulée"""
+        deadline = time.monotonic() + delay
+        while True:
+            self.__check_cancelled(check_interrupt)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.2))
+
+    def __retry_delay(self, attempt, retry_after=None):
+        """Délai avant la prochaine tentative : Retry-After s'il est fourni, sinon exponentiel avec gigue"""
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass  # Format date HTTP : on se rabat sur le délai exponentiel
+        return self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_factor)
+
+    def __extract_collaborators(self, start_year, end_year=None, check_interrupt=None, progress=None, per_work=False):
+        """Méthode privée pour l’extraction de la liste des pays collaborateurs pour la période."""
+        # Les pays sont comptés au fil du téléchargement, sans conserver les publications
+        countries = CountryAggregator(per_work)
+        self.__consume(start_year, end_year, [countries], check_interrupt, progress)
+        return countries.counts
     
-    def __collaborators_excel_file(self, country_counts):
+    def __collaborators_excel_file(self, country_counts, per_work=False):
          # Convertir en DataFrame pour l'export Excel
-        df = pd.DataFrame(country_counts.items(), columns=["Pays", "Nombre de publications"])
-        df.sort_values(by="Nombre de publications", ascending=False, inplace=True)
+        # Le libellé d'origine est conservé pour le décompte par institution ; le décompte par publication est distingué
+        column = "Nombre de publications distinctes" if per_work else "Nombre de publications"
+        df = pd.DataFrame(country_counts.items(), columns=["Pays", column])
+        df.sort_values(by=column, ascending=False, inplace=True)
 
-        # Sauvegarder le fichier Excel
-        df.to_excel("pays_collaborateurs_ets.xlsx", index=False, engine="openpyxl")
-        print("✅ La liste des pays collaborateurs a été enregistrée dans 'pays_collaborateurs_ets.xlsx'.")
+        # Sauvegarder le fichier (Excel par défaut)
+        paths = self.exporter.export(df, "pays_collaborateurs_ets")
+        logger.info(f"✅ La liste des pays collaborateurs a été enregistrée dans {', '.join(repr(path) for path in paths)}.")
     
+    def __year_runs(self, years):
+        """Regroupe une liste triée d'années en intervalles consécutifs [(début, fin)]"""
+        runs = []
+        for year in years:
+            if runs and runs[-1][1] == year - 1:
+                runs[-1] = (runs[-1][0], year)
+            else:
+                runs.append((year, year))
+        return runs
+
+    def __trend(self, start_year, end_year=None, collaborator_ror=None, check_interrupt=None, progress=None, top=5):
+        """Séries annuelles d'un rapport de tendances (publications, principaux pays et sujets) et leurs graphiques"""
+        end_year = end_year or start_year
+        partitions = self.yearly_counts(start_year, end_year, collaborator_ror, check_interrupt, progress)
+        years = list(range(start_year, end_year + 1))
+        suffix = f"_{short_ror(collaborator_ror)}" if collaborator_ror else ""
+        subject = f"co-publications de l'ÉTS avec {collaborator_ror}" if collaborator_ror else "publications de l'ÉTS"
+
+        publications = {"Publications": [partitions[year]["publications"] for year in years]}
+        dimensions = []
+        for dimension, label in (("countries", "Pays"), ("topics", "Sujets")):
+            totals = Counter()
+            for year in years:
+                totals.update(partitions[year][dimension])
+            series = {key: [partitions[year][dimension].get(key, 0) for year in years] for key, _ in totals.most_common(top)}
+            dimensions.append((label, series))
+
+        charts = [(LineChart(years, publications, f"Évolution des {subject}"), f"tendance_publications{suffix}")]
+        charts += [(LineChart(years, series, f"{label} : {top} principaux, par année"), f"tendance_{label.lower()}{suffix}")
+                   for label, series in dimensions if series]
+        return {"start_year": start_year, "end_year": end_year, "subject": subject, "suffix": suffix, "years": years,
+                "publications": publications, "dimensions": dimensions, "charts": charts, "top": top}
+
+    def __write_trend_reports(self, trends, images):
+        """Tableaux annuels et rapports word des tendances, à partir des images de leurs graphiques (dans l'ordre)"""
+        # Word n'accepte pas le SVG
+        if self.chart_format != "png":
+            images = render_many([chart for trend in trends for chart, _ in trend["charts"]], "png", self.chart_dpi)
+        position = 0
+        for trend in trends:
+            trend_images = images[position:position + len(trend["charts"])]
+            position += len(trend["charts"])
+            # Tableau annuel complet (publications, puis chaque pays et sujet représenté)
+            table = pd.DataFrame({"Année": trend["years"], **trend["publications"],
+                                  **{f"{label} : {key}": values for label, series in trend["dimensions"] for key, values in series.items()}})
+            self.exporter.export(table, f"tendances{trend['suffix']}")
+
+            with self.metrics.stage("word"):
+                self.__write_trend_document(trend["start_year"], trend["end_year"], trend["subject"], trend["suffix"], trend["years"],
+                                            trend["publications"], trend["dimensions"], trend_images, trend["top"])
+
+    def __write_trend_document(self, start_year, end_year, subject, suffix, years, publications, dimensions, images, top):
+        """Rapport word des tendances : graphiques (PNG en mémoire) et tableaux annuels"""
+        doc = Document()
+        doc.add_heading(f"Évolution annuelle des {subject}", level=1)
+        doc.add_paragraph(f"Les graphiques et tableaux ci-dessous présentent l'évolution des {subject} de {start_year} à {end_year}, "
+                          "avec la variation par rapport à l'année précédente.")
+        doc.add_picture(BytesIO(images[0]), width=Inches(6))
+        self.__add_trend_table(doc, years, publications)
+        for (label, series), image in zip([item for item in dimensions if item[1]], images[1:]):
+            doc.add_heading(f"{label} : {top} principaux", level=2)
+            doc.add_picture(BytesIO(image), width=Inches(6))
+            self.__add_trend_table(doc, years, series)
+
+        path = self.exporter.path(f"rapport_tendances{suffix}.docx")
+        doc.save(path)
+        logger.info(f"✅ Rapport Word des tendances généré avec succès : {path}")
+
+    def __add_trend_table(self, doc, years, series):
+        """Tableau annuel (une ligne par année, une colonne par série), avec la variation par rapport à l'année précédente"""
+        table = doc.add_table(rows=1, cols=len(series) + 1)
+        table.style = "Table Grid"
+        for cell, title in zip(table.rows[0].cells, ["Année", *series]):
+            cell.text = str(title)
+        for i, year in enumerate(years):
+            cells = table.add_row().cells
+            cells[0].text = str(year)
+            for cell, values in zip(cells[1:], series.values()):
+                cell.text = str(values[i])
+                if i and values[i - 1]:
+                    cell.text += f" ({(values[i] - values[i - 1]) / values[i - 1] * 100:+.0f} %)"
+
     def __generate_publication_year_filter(self, start_year, end_year=None):
         """Génère la chaîne de filtre publication_year pour l'API OpenAlex."""
         if end_year is None:  # Si une seule année est donnée
@@ -164,76 +2013,49 @@ class MyApi():
         return f"{years}"
     
     def __generate_graph(self, country_counts):
-        # Obtenir les 10 principaux pays
-        top_countries = country_counts.most_common(10)
-
-        countries, counts = zip(*top_countries)
-
-        # Créer le graphique
-        plt.figure(figsize=(10, 5))
-        plt.bar(countries, counts, color='royalblue')
-        plt.xlabel("Pays")
-        plt.ylabel("Nombre de publications")
-        plt.title("Top 10 des pays collaborateurs")
-        plt.xticks(rotation=45)
-        plt.grid(axis='y', linestyle="--", alpha=0.7)
-
-        # Sauvegarder le graphique
-        plt.savefig("top_countries.png", bbox_inches="tight")
-        plt.close()
-        
+        """Graphique des 10 principaux pays : enregistré dans le format choisi, renvoyé en PNG pour le rapport Word"""
+        chart = BarChart(country_counts, "Top 10 des pays collaborateurs", "Pays", "Nombre de publications", top=10)
+        image = self.__save_charts([(chart, "top_countries")])[0]
+        # Word n'accepte pas le SVG
+        return image if self.chart_format == "png" else render(chart, "png", self.chart_dpi)
         
-    def __generate_graph_topics(self, topics_count):
-        # Obtenir les 10 principaux pays
-        top_topics = topics_count.most_common(20)
-
+    def __topics_chart(self, topics_count):
+        """Graphique des 20 principaux sujets"""
         try:
-            topics, counts = zip(*top_topics)
-
-            # Créer le graphique
-            plt.figure(figsize=(12, 6))
-            plt.bar(topics, counts, color='royalblue')
-            plt.xlabel("Sujets")
-            plt.ylabel("Nombre de publications")
-            plt.title("Top 20 des sujets de collaboration avec l'ÉTS")
-            plt.xticks(rotation=30, ha="right", fontsize=10)
-            plt.grid(axis='y', linestyle="--", alpha=0.7)
-
-            # Sauvegarder le graphique
-            plt.savefig("top_topics.png", bbox_inches="tight")
-            plt.close()
-            print("✅ Graphique généré avec succès: top_topics.png")
-        
-        except(ValueError):
+            return BarChart(topics_count, "Top 20 des sujets de collaboration avec l'ÉTS", "Sujets", "Nombre de publications",
+                            top=20, figsize=(12, 6), rotation=30, ha="right", fontsize=10)
+        except ValueError:
             raise ValueError("ROR INVALIDE")
-        
 
-    def __insert_into_word(self, start_year, end_year=None):
-        """Génère un rapport word avec le graphe généré"""
-        doc = Document()
-        doc.add_heading("Analyse des collaborations internationales", level=1)
+    def __save_charts(self, charts):
+        """Rend les graphiques [(BarChart, nom sans extension)] et les enregistre ; renvoie les images produites"""
+        with self.metrics.stage("charts"):
+            images = render_many([chart for chart, _ in charts], self.chart_format, self.chart_dpi)
+        for (_, name), image in zip(charts, images):
+            path = self.exporter.path(f"{name}.{self.chart_format}")
+            with open(path, "wb") as file:
+                file.write(image)
+            logger.info(f"✅ Graphique généré avec succès: {path}")
+        return images
+
+    def __insert_into_word(self, start_year, end_year=None, image=None):
+        """Génère un rapport word avec le graphe des pays (image PNG en mémoire)"""
+        with self.metrics.stage("word"):
+            doc = Document()
+            doc.add_heading("Analyse des collaborations internationales", level=1)
 
-        doc.add_paragraph(f"Le graphique ci-dessous présente les 10 principaux pays ayant collaboré avec l'ÉTS sur les publications de {start_year} à {end_year}.")
+            doc.add_paragraph(f"Le graphique ci-dessous présente les 10 principaux pays ayant collaboré avec l'ÉTS sur les publications de {start_year} à {end_year}.")
 
-        doc.add_picture("top_countries.png", width=Inches(6))
+            doc.add_picture(BytesIO(image), width=Inches(6))
 
-        doc.save("rapport_collaborations.docx")
-        print("✅ Rapport Word généré avec succès : rapport_collaborations.docx")
+            path = self.exporter.path("rapport_collaborations.docx")
+            doc.save(path)
+        logger.info(f"✅ Rapport Word généré avec succès : {path}")
 
             
-    def __generate_excel_file(self, all_results):
+    def __generate_excel_file(self, publications_data):
         
-        """Génère un fichier excel à partir des résultats obtenus"""
-        # Extraire les données dans une liste de dictionnaires
-        publications_data = [
-            {
-                "Titre": pub.get("display_name", "Non disponible"),
-                "Année": pub.get("publication_year", "Non disponible"),
-                "Lien vers l'article": pub.get("doi", "Non disponible"),
-            }
-            for pub in all_results
-        ]
-
+        """Génère un fichier excel à partir des lignes produites par PublicationAggregator (ou de WorkTable.publications())"""
         # Convertir en DataFrame
         df = pd.DataFrame(publications_data)
 
@@ -241,15 +2063,9 @@ class MyApi():
         df['Année'] = pd.to_numeric(df['Année'], errors='coerce')  
         df.sort_values(by='Année', ascending=True, inplace=True)
 
-        # Sauvegarder sous Excel avec plusieurs feuilles (sheets)
-        filename = "publications.xlsx"
-        batch_size = 1000  # Nombre de publications par feuille
-
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            for i in range(0, len(df), batch_size):
-                sheet_name = f"Sheet_{(i // batch_size) + 1}"
-                df.iloc[i:i + batch_size].to_excel(writer, sheet_name=sheet_name, index=False)
+        # Sauvegarder (Excel : plusieurs feuilles de 1000 publications)
+        paths = self.exporter.export(df, "publications", sheet_size=1000)
 
-        print(f"✅ Les données ont été enregistrées dans '{filename}', divisées en plusieurs feuilles.")
+        logger.info(f"✅ Les données ont été enregistrées dans {', '.join(repr(path) for path in paths)}.")
 
             
@@ -0,0 +1,172 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from classes import MyApi, Exporter, RecordingTransport, ReplayTransport, Metrics, JsonFormatter
+from charts import FORMATS as CHART_FORMATS
+
+
+logger = logging.getLogger("openalex.cli")
+
+OPERATIONS = {
+    "works": "Liste des publications (publications.xlsx)",
+    "collaborators": "Liste des pays collaborateurs (pays_collaborateurs_ets.xlsx)",
+    "report": "Rapport word des 10 principaux pays collaborateurs",
+    "partners": "Principaux partenaires et graphe de collaboration (GraphML, liste d'arêtes)",
+    "topics": "Principaux sujets des publications avec un collaborateur (ROR requis)",
+    "trends": "Évolution annuelle des publications, pays et sujets (rapport word), des co-publications si --ror est donné",
+    "all": "Tous les livrables à partir d'un seul téléchargement (ROR requis)",
+    "compare": "Comparaison des pays et sujets de plusieurs institutions (--institution)",
+}
+
+
+def parse_years(value):
+    """Convertit '2019-2023' ou '2021' en (année de début, année de fin)"""
+    try:
+        start, _, end = value.partition("-")
+        start = int(start)
+        end = int(end) if end else start
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Période invalide : {value} (format attendu : 2019-2023 ou 2021)")
+    if start > end:
+        raise argparse.ArgumentTypeError("L'année de début ne peut pas être supérieure à l'année de fin")
+    return (start, end)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ETS OpenAlex Analyzer - génération des rapports sans interface graphique")
+    parser.add_argument("operation", choices=OPERATIONS, help=" ; ".join(f"{k} : {v}" for k, v in OPERATIONS.items()))
+    parser.add_argument("-y", "--years", type=parse_years, action="append", required=True,
+                        help="Période à analyser (ex. 2019-2023), option répétable pour un traitement par lots")
+    parser.add_argument("-r", "--ror", action="append", default=[],
+                        help="ROR du collaborateur (ex. https://ror.org/02feahw73), option répétable")
+    parser.add_argument("-i", "--institution", action="append", default=[],
+                        help="ROR d'une institution analysée (ÉTS par défaut), option répétable ; la première sert de référence")
+    parser.add_argument("-o", "--output-dir", default="resultats", help="Répertoire des fichiers produits")
+    parser.add_argument("-f", "--format", action="append", choices=Exporter.FORMATS,
+                        help="Format des tableaux produits (xlsx par défaut), option répétable")
+    parser.add_argument("--cache", default="openalex_cache.sqlite",
+                        help="Fichier du cache local, partagé par tous les traitements ('' pour le désactiver)")
+    parser.add_argument("--cache-max-age", type=int, default=1,
+                        help="Âge maximal (en jours) d'une année du cache avant son retéléchargement complet ; en deçà, "
+                             "elle est lue depuis le cache (sans clé d'API) ou mise à jour (avec une clé)")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre d'années téléchargées simultanément")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Nombre de processus exécutant les périodes en parallèle")
+    parser.add_argument("--chart-format", choices=CHART_FORMATS, default="png",
+                        help="Format des graphiques enregistrés (le rapport Word contient toujours une image PNG)")
+    parser.add_argument("--dpi", type=int, default=100, help="Résolution des graphiques")
+    parser.add_argument("--top", type=int, default=20, help="Nombre de partenaires listés (opération partners)")
+    parser.add_argument("--per-work", action="store_true",
+                        help="Pays comptés une fois par publication plutôt qu'à chaque institution des co-auteurs")
+    parser.add_argument("--mailto", help="Adresse courriel transmise à OpenAlex (polite pool)")
+    parser.add_argument("--api-key", help="Clé d'API OpenAlex")
+    parser.add_argument("--log-json", metavar="FICHIER",
+                        help="Journal détaillé (une ligne JSON par événement, y compris chaque requête)")
+    parser.add_argument("--metrics-file", metavar="FICHIER",
+                        help="Mesures d'exécution en fin de traitement : format textfile de Prometheus si le fichier "
+                             "se termine par .prom, JSON sinon")
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument("--record", metavar="REPERTOIRE",
+                        help="Enregistre les réponses d'OpenAlex dans un répertoire (cache local désactivé)")
+    fixtures.add_argument("--replay", metavar="REPERTOIRE",
+                        help="Rejoue les réponses enregistrées avec --record, sans accès au réseau (cache local désactivé)")
+    return parser
+
+
+def configure_logging(args):
+    """Messages à l'écran ; journal JSON détaillé (niveau DEBUG) si --log-json est donné"""
+    log = logging.getLogger("openalex")
+    log.setLevel(logging.DEBUG if args.log_json else logging.INFO)
+    if log.handlers:
+        return
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(logging.INFO)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(console)
+    if args.log_json:
+        # Ajout en fin de fichier : plusieurs processus peuvent écrire dans le même journal
+        json_log = logging.FileHandler(args.log_json, encoding="utf-8")
+        json_log.setFormatter(JsonFormatter())
+        log.addHandler(json_log)
+
+
+def run_period(args, start, end):
+    """Exécute l'opération pour une période et tous les ROR demandés, dans un même processus.
+
+    Tous les ROR d'une période sont traités par un seul appel à run_reports : les publications ne sont téléchargées qu'une
+    fois et les graphiques de tous les collaborateurs sont rendus ensemble.
+    Renvoie le répertoire des fichiers produits et les mesures d'exécution (Metrics.snapshot()).
+    """
+    output_dir = os.path.join(args.output_dir, f"{start}-{end}")
+    # Les requêtes de synchronisation incrémentale (from_updated_date) changent d'un jour à l'autre : pas de cache
+    # pendant un enregistrement ou un rejeu, pour que les mêmes requêtes soient envoyées
+    transport = RecordingTransport(args.record) if args.record else ReplayTransport(args.replay) if args.replay else None
+    api = MyApi(cache_path=None if transport else args.cache or None, api_key=args.api_key, max_workers=args.workers,
+                mailto=args.mailto, output_dir=output_dir, export_formats=tuple(args.format or ("xlsx",)), transport=transport,
+                chart_format=args.chart_format, chart_dpi=args.dpi, cache_max_age=args.cache_max_age,
+                **({"institution_rors": args.institution} if args.institution else {}))
+
+    if args.operation == "works":
+        api.show_works(start, end)
+    elif args.operation == "collaborators":
+        api.show_collaborators(start, end, per_work=args.per_work)
+    elif args.operation == "report":
+        api.generate_country_report(start, end, per_work=args.per_work)
+    elif args.operation == "partners":
+        api.show_top_partners(start, end, k=args.top)
+    elif args.operation == "compare":
+        api.compare_institutions(start, end)
+    else:
+        # Fichiers de chaque collaborateur suffixés par son ROR (top_topics_<ROR>, tendances_<ROR>...) ; sans ROR, les
+        # tendances portent sur toutes les publications de l'institution
+        operations = [("trends" if args.operation == "trends" else "topics", ror) for ror in args.ror or [None]]
+        if args.operation == "all":
+            operations = [("works", None), ("collaborators", None), ("report", None)] + operations
+        api.run_reports(start, end, operations, per_work=args.per_work)
+    return output_dir, api.metrics.snapshot()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args)
+    if args.operation in ("topics", "all") and not args.ror:
+        logger.error(f"❌ L'opération '{args.operation}' nécessite au moins un ROR collaborateur (--ror)")
+        return 2
+
+    # Les doublons de périodes ne sont traités qu'une fois
+    periods = list(dict.fromkeys(args.years))
+    failures = 0
+    # Mesures de toutes les périodes, y compris celles traitées dans d'autres processus
+    metrics = Metrics()
+
+    def report(start, end, run):
+        nonlocal failures
+        try:
+            output_dir, snapshot = run()
+        except Exception as e:
+            failures += 1
+            logger.error(f"❌ {start}-{end} : {e}", extra={"event": "period_failed", "period": f"{start}-{end}"})
+            return
+        metrics.merge(snapshot)
+        logger.info(f"✅ {start}-{end} : fichiers enregistrés dans {output_dir}",
+                    extra={"event": "period_done", "period": f"{start}-{end}", "output_dir": output_dir})
+
+    if args.processes > 1 and len(periods) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.processes, len(periods)),
+                                 initializer=configure_logging, initargs=(args,)) as executor:
+            futures = {executor.submit(run_period, args, start, end): (start, end) for start, end in periods}
+            for future, (start, end) in futures.items():
+                report(start, end, future.result)
+    else:
+        for start, end in periods:
+            report(start, end, lambda: run_period(args, start, end))
+
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+        logger.info(f"✅ Mesures d'exécution enregistrées dans {args.metrics_file} : {metrics.summary()}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
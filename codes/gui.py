@@ -1,12 +1,224 @@
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
-from classes import MyApi
-import sys
-import io
+from classes import MyApi, OperationCancelled
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging.handlers import QueueHandler
+import logging
+import os
+import queue
 import threading
 import ssl
 
 
+logger = logging.getLogger("openalex.gui")
+
+
+# Libellés des opérations dans la liste des tâches
+OPERATION_LABELS = {
+    "works": "Publications",
+    "collaborators": "Pays collaborateurs",
+    "report": "Rapport word",
+    "topics": "Sujets avec le collaborateur",
+    "partners": "Principaux partenaires",
+    "trends": "Tendances par année",
+    "all": "Tous les rapports",
+}
+
+
+class Job:
+    """Opération demandée depuis l'interface"""
+
+    def __init__(self, job_id, operation, start, end, ror=None):
+        self.id = job_id
+        self.operation = operation
+        self.start = start
+        self.end = end
+        self.ror = ror
+        self.status = "En attente"
+        self.cancelled = False
+
+
+class JobGroup:
+    """Tâches portant sur la même période, exécutées ensemble à partir d'un seul téléchargement"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.jobs = []
+        self.started = False
+        # Téléchargement de la période (SharedDownload) utilisé par le groupe, le cas échéant
+        self.download = None
+
+    def check_interrupt(self):
+        """Interrompt le téléchargement commun lorsque toutes les tâches du groupe sont annulées"""
+        if all(job.cancelled for job in self.jobs):
+            raise OperationCancelled("Traitement interrompu par l'utilisateur")
+
+
+class SharedDownload:
+    """Téléchargement d'une période (WorkTable), rejoint par les groupes démarrés pendant qu'il est en cours"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.groups = []
+        # Résultat (WorkTable) ou erreur du téléchargement, attendu par les groupes qui l'ont rejoint
+        self.future = Future()
+
+    def jobs(self):
+        return [job for group in list(self.groups) for job in group.jobs]
+
+    def check_interrupt(self):
+        """Interrompt le téléchargement lorsque toutes les tâches qui l'attendent sont annulées"""
+        if all(job.cancelled for job in self.jobs()):
+            raise OperationCancelled("Traitement interrompu par l'utilisateur")
+
+
+class JobScheduler:
+    """File de tâches exécutées par un nombre borné de fils ; les tâches d'une même période sont regroupées
+
+    Une tâche rejoint le groupe en attente pour sa période ; si le groupe a déjà démarré, le groupe suivant rejoint son
+    téléchargement tant qu'il est en cours, plutôt que d'en lancer un second.
+    """
+
+    def __init__(self, api, on_event, max_jobs=2):
+        self.api = api
+        # on_event(type, tâche, valeur) est appelée depuis les fils de traitement
+        self.on_event = on_event
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.groups = {}
+        # Téléchargements en cours, par période
+        self.downloads = {}
+        self.next_id = 1
+
+    def submit(self, operation, start, end, ror=None):
+        """Ajoute une tâche ; elle rejoint un groupe en attente pour la même période s'il en existe un"""
+        with self.lock:
+            job = Job(self.next_id, operation, start, end, ror)
+            self.next_id += 1
+            group = self.pending.get((start, end))
+            if group is None:
+                group = JobGroup(start, end)
+                self.pending[(start, end)] = group
+                self.executor.submit(self.__run_group, group)
+            group.jobs.append(job)
+            self.groups[job.id] = group
+        return job
+
+    def cancel(self, job_id):
+        """Annule une tâche ; le téléchargement est interrompu si plus aucune tâche du groupe n'en a besoin"""
+        with self.lock:
+            group = self.groups.get(job_id)
+            job = next((job for job in group.jobs if job.id == job_id), None) if group else None
+            if job is None or job.status in ("Terminée", "Erreur", "Annulée"):
+                return
+            job.cancelled = True
+            job.status = "Annulée"
+            abort = []
+            if group.started and all(other.cancelled for other in group.jobs):
+                abort.append(group.check_interrupt)
+            # Le téléchargement partagé n'est interrompu que si plus aucun des groupes qui l'attendent n'en a besoin
+            if group.download is not None and all(other.cancelled for other in group.download.jobs()):
+                abort.append(group.download.check_interrupt)
+        self.on_event("status", job, job.status)
+        for check_interrupt in abort:
+            self.api.abort(check_interrupt)
+
+    def shutdown(self):
+        """Annule toutes les tâches et arrête les fils de traitement"""
+        for job_id in list(self.groups):
+            self.cancel(job_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __run_group(self, group):
+        try:
+            self.__run_jobs(group)
+        finally:
+            # Tâches terminées : plus rien à annuler, le groupe n'est plus référencé
+            with self.lock:
+                for job in group.jobs:
+                    self.groups.pop(job.id, None)
+
+    def __run_jobs(self, group):
+        with self.lock:
+            # Plus aucune tâche ne peut rejoindre ce groupe
+            self.pending.pop((group.start, group.end), None)
+            group.started = True
+            jobs = [job for job in group.jobs if not job.cancelled]
+            for job in jobs:
+                job.status = "En cours"
+        if not jobs:
+            return
+        for job in jobs:
+            self.on_event("status", job, job.status)
+
+        def progress(state):
+            for job in jobs:
+                self.on_event("progress", job, state)
+
+        # Un répertoire par période : des tâches simultanées n'écrasent pas leurs fichiers
+        api = self.api.with_output_dir(os.path.join(self.api.exporter.output_dir, f"{group.start}-{group.end}"))
+        operations = [(job.operation, job.ror) for job in jobs]
+        try:
+            table = None
+            if api.needs_work_table(operations):
+                table = self.__shared_table(group, partners=api.needs_collaboration_index(operations))
+            # Tâches annulées pendant l'attente du téléchargement partagé
+            group.check_interrupt()
+            api.run_reports(group.start, group.end, operations, group.check_interrupt, progress=progress, table=table)
+        except Exception as e:
+            for job in jobs:
+                if not job.cancelled:
+                    job.status = "Erreur"
+                    self.on_event("error", job, str(e))
+        else:
+            for job in jobs:
+                if not job.cancelled:
+                    job.status = "Terminée"
+        for job in jobs:
+            self.on_event("status", job, job.status)
+
+    def __shared_table(self, group, partners=False):
+        """WorkTable de la période : téléchargée par le premier groupe, attendue par ceux qui démarrent pendant le téléchargement
+
+        partners : l'index de collaboration est construit pendant le téléchargement (sinon, un groupe qui le rejoint et en a
+        besoin le construit à partir du cache local).
+        """
+        key = (group.start, group.end)
+        with self.lock:
+            download = self.downloads.get(key)
+            owner = download is None
+            if owner:
+                download = self.downloads[key] = SharedDownload(group.start, group.end)
+            download.groups.append(group)
+            group.download = download
+        if not owner:
+            return download.future.result()
+
+        def progress(state):
+            for job in download.jobs():
+                if not job.cancelled:
+                    self.on_event("progress", job, state)
+
+        try:
+            table = self.api.build_work_table(group.start, group.end, download.check_interrupt, progress, partners=partners)
+        except BaseException as e:
+            self.__close_download(key, download)
+            download.future.set_exception(e)
+            raise
+        self.__close_download(key, download)
+        download.future.set_result(table)
+        return table
+
+    def __close_download(self, key, download):
+        # Les groupes démarrés ensuite lancent un nouveau téléchargement (servi par le cache local)
+        with self.lock:
+            if self.downloads.get(key) is download:
+                del self.downloads[key]
+
+
 class App:
     def __init__(self):
         
@@ -15,12 +227,13 @@ class App:
         self.api = MyApi()
         self.root = tk.Tk()
         self.root.title("ETS OpenAlex Analyzer")
-        self.is_processing = False
-        self.progress_window = None
+        # Événements (statut, avancement, erreurs) émis par les fils de traitement et traités par la boucle Tk
+        self.events = queue.Queue()
+        self.scheduler = JobScheduler(self.api, lambda *event: self.events.put(event))
 
         # Configuration de la grille
-        self.root.grid_rowconfigure(3, weight=1)
-        self.root.grid_columnconfigure((0, 1, 2, 3), weight=1)
+        self.root.grid_rowconfigure((3, 4), weight=1)
+        self.root.grid_columnconfigure((0, 1, 2, 3, 4, 5, 6), weight=1)
         
         # Validation numérique pour les années
         val_num = self.root.register(self.__validate_year_input)
@@ -40,14 +253,17 @@ class App:
         tk.Label(self.root, text="ROR Collaborateur:").grid(row=1, column=0, sticky="w")
         self.ror_entry = tk.Entry(self.root)
         self.ror_entry.insert(0, "https://ror.org/02feahw73") # ROR du CNRS par défaut
-        self.ror_entry.grid(row=1, column=1, columnspan=3, sticky="ew")
+        self.ror_entry.grid(row=1, column=1, columnspan=6, sticky="ew")
         
         # Boutons
         buttons = [
             ("Récupérer les publications", self.fetch_works),
             ("Lister pays collaborateurs", self.show_collaborators),
             ("Générer rapport word", self.generate_report),
-            ("Sujets principaux avec le collaborateur", self.analyze_collaboration)
+            ("Sujets principaux avec le collaborateur", self.analyze_collaboration),
+            ("Principaux partenaires", self.show_top_partners),
+            ("Tendances par année", self.show_trends),
+            ("Générer tous les rapports", self.generate_all_reports)
         ]
         
         for i, (text, cmd) in enumerate(buttons):
@@ -57,11 +273,29 @@ class App:
         
         # Zone de logs
         self.log_area = scrolledtext.ScrolledText(self.root, state="disabled")
-        self.log_area.grid(row=3, column=0, columnspan=4, sticky="nsew")
+        self.log_area.grid(row=3, column=0, columnspan=7, sticky="nsew")
+        
+        # Liste des tâches
+        self.jobs_view = ttk.Treeview(self.root, columns=("operation", "period", "status", "progress"), show="headings", height=6)
+        for column, title, width in (("operation", "Opération", 260), ("period", "Période", 90),
+                                     ("status", "Statut", 90), ("progress", "Avancement", 360)):
+            self.jobs_view.heading(column, text=title)
+            self.jobs_view.column(column, width=width)
+        self.jobs_view.grid(row=4, column=0, columnspan=6, sticky="nsew")
+        tk.Button(self.root, text="Annuler la tâche", command=self.__cancel_selected_job).grid(
+            row=4, column=6, sticky="new", padx=2, pady=2
+        )
         
-        # Redirection de la sortie
-        self.output = io.StringIO()
-        sys.stdout = self.output
+        # Mesures d'exécution (requêtes, débit, cache)
+        self.metrics_label = tk.Label(self.root, anchor="w")
+        self.metrics_label.grid(row=5, column=0, columnspan=7, sticky="ew")
+        
+        # Journal : les messages de tous les fils sont placés dans une file, lue par la boucle Tk
+        self.log_records = queue.Queue()
+        self.log_handler = QueueHandler(self.log_records)
+        self.log_handler.setFormatter(logging.Formatter("%(message)s"))
+        logging.getLogger("openalex").addHandler(self.log_handler)
+        logging.getLogger("openalex").setLevel(logging.INFO)
         
         # Mise à jour périodique des logs
         self.update_log()
@@ -94,152 +328,122 @@ class App:
             messagebox.showerror("Erreur de saisie", str(e))
             return None
 
-    def __show_processing(self):
-        """Affiche une fenêtre de progression centrée"""
-        self.is_processing = True
-        self.should_stop = False
-        
-        # Création de la fenêtre
-        self.progress_window = tk.Toplevel(self.root)
-        self.progress_window.title("Traitement en cours")
-        
-        # Création du contenu
-        frame = tk.Frame(self.progress_window)
-        frame.pack(pady=10, padx=20)
-        
-        tk.Label(frame, text="Veuillez patienter, traitement en cours...").grid(row=0, column=0)
-        self.progress = ttk.Progressbar(frame, mode='indeterminate')
-        self.progress.grid(row=1, column=0, pady=5)
-        self.progress.start()
-        
-        cancel_btn = tk.Button(frame, text="Annuler", command=self.__cancel_operation)
-        cancel_btn.grid(row=2, column=0, pady=10)
-        
-        # Calcul du centrage
-        self.progress_window.update_idletasks()  # Force le calcul des dimensions
-        
-        main_width = self.root.winfo_width()
-        main_height = self.root.winfo_height()
-        main_x = self.root.winfo_x()
-        main_y = self.root.winfo_y()
-        
-        progress_width = self.progress_window.winfo_width()
-        progress_height = self.progress_window.winfo_height()
-        
-        x = main_x + (main_width - progress_width) // 2
-        y = main_y + (main_height - progress_height) // 2
-        
-        self.progress_window.geometry(f"+{x}+{y}")  # Positionnement au centre
-        
-        # Configuration finale
-        self.progress_window.transient(self.root)  # Lien hiérarchique
-        self.progress_window.grab_set()
-        self.progress_window.protocol("WM_DELETE_WINDOW", self.__cancel_operation)
-
-    def __cancel_operation(self):
-        """Gère la demande d'annulation par l'utilisateur"""
-        self.should_stop = True
-        self.__hide_processing()
-        print("⏹ Traitement annulé par l'utilisateur")
-        
-    def __hide_processing(self):
-        """Cache la fenêtre de progression"""
-        if self.progress_window:
-            self.progress_window.destroy()
-        self.is_processing = False
-        
-    def __thread_wrapper(self, target_method, args=()):
-        """Lance une méthode dans un thread séparé"""
-        if self.is_processing:
-            return
-            
-        self.should_stop = False  # Réinitialiser l'état d'annulation
-        
-        def thread_target():
+    def __format_progress(self, state):
+        """Texte d'avancement (pages, publications, total, débit, temps restant)"""
+        text = f"{state['pages']} page(s) - {state['records']}"
+        if state["total"]:
+            text += f" / {state['total']}"
+        text += f" publications - {state['rate']:.0f} pub/s"
+        if state["eta"] is not None and state["total"]:
+            text += f" - reste ~{state['eta']:.0f} s"
+        return text
+
+    def __submit(self, operation, start, end, ror=None):
+        """Ajoute une tâche à la file et à la liste affichée"""
+        job = self.scheduler.submit(operation, start, end, ror)
+        label = OPERATION_LABELS[operation] + (f" ({ror})" if ror else "")
+        self.jobs_view.insert("", "end", iid=str(job.id), values=(label, f"{start}-{end}", job.status, ""))
+
+    def __cancel_selected_job(self):
+        """Annule les tâches sélectionnées dans la liste"""
+        for iid in self.jobs_view.selection():
+            self.scheduler.cancel(int(iid))
+
+    def __process_events(self):
+        """Traite les événements émis par les fils de traitement (appelée uniquement depuis la boucle Tk)"""
+        while True:
             try:
-                self.__show_processing()
-                target_method(*args)
-            finally:
-                self.root.after(0, self.__hide_processing)
-        
-        threading.Thread(target=thread_target, daemon=True).start()
+                kind, job, value = self.events.get_nowait()
+            except queue.Empty:
+                return
+            iid = str(job.id)
+            if not self.jobs_view.exists(iid):
+                continue
+            if kind == "status":
+                self.jobs_view.set(iid, "status", value)
+                if value == "Terminée":
+                    logger.info(f"✅ {self.jobs_view.set(iid, 'operation')} {job.start}-{job.end} terminée")
+            elif kind == "progress":
+                self.jobs_view.set(iid, "progress", self.__format_progress(value))
+            elif kind == "error":
+                logger.error(f"❌ {self.jobs_view.set(iid, 'operation')} {job.start}-{job.end} : {value}")
+                messagebox.showerror("Erreur", value)
 
     def update_log(self):
         """Gestion des messages sur la fenêtre principale"""
-        self.log_area.config(state="normal")
-        self.log_area.insert("end", self.output.getvalue())
-        self.log_area.see("end")
-        self.log_area.config(state="disabled")
-        self.output.truncate(0)
-        self.output.seek(0)
+        self.__process_events()
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_records.get_nowait().getMessage())
+            except queue.Empty:
+                break
+        if lines:
+            self.log_area.config(state="normal")
+            self.log_area.insert("end", "\n".join(lines) + "\n")
+            self.log_area.see("end")
+            self.log_area.config(state="disabled")
+        self.metrics_label.config(text=self.api.metrics.summary())
         self.root.after(100, self.update_log)
         
     def fetch_works(self):
         years = self.__get_validated_years()
         if not years:
             return
-        self.__thread_wrapper(self.__fetch_works_task, years)
-    
-    def __fetch_works_task(self, start, end):
-        try:
-            self.api.show_works(start, end, self._check_stop)
-            if self.should_stop: return
-            print(f"✅ Publications {start}-{end} récupérées avec succès")
-        except Exception as e:
-            if not self.should_stop:  # Ne pas afficher l'erreur si annulation
-                messagebox.showerror("Erreur", str(e))
-    
-    def _check_stop(self):
-        """Vérification des interruptions pendant les opérations"""
-        if self.should_stop:
-            raise Exception("Traitement interrompu par l'utilisateur")
+        self.__submit("works", *years)
         
     def show_collaborators(self):
         years = self.__get_validated_years()
         if not years:
             return
-        self.__thread_wrapper(self.__show_collaborators_task, years)
-    
-    def __show_collaborators_task(self, start, end):
-        self.api.show_collaborators(start, end, self._check_stop)
-        print(f"✅ Liste des collaborateurs {start}-{end} générée")
+        self.__submit("collaborators", *years)
     
     def generate_report(self):
         years = self.__get_validated_years()
         if not years:
             return
-        self.__thread_wrapper(self.__generate_report_task, years)
-    
-    def __generate_report_task(self, start, end):
-        self.api.generate_country_report(start, end, self._check_stop)
+        self.__submit("report", *years)
     
     def analyze_collaboration(self):
-        try:
-            ror = self.ror_entry.get().strip()
-            if not ror:
-                messagebox.showerror("Erreur", "ROR collaborateur requis")
-                return
-                
-            years = self.__get_validated_years()
-            if not years:
-                return
-                
-            self.__thread_wrapper(self.__analyze_collaboration_task, (ror, *years))
+        ror = self.ror_entry.get().strip()
+        if not ror:
+            messagebox.showerror("Erreur", "ROR collaborateur requis")
+            return
             
-        except Exception as e:
-            messagebox.showerror("Erreur", str(e))
+        years = self.__get_validated_years()
+        if not years:
+            return
+            
+        self.__submit("topics", *years, ror)
     
-    def __analyze_collaboration_task(self, ror, start, end):
-        try:
-            self.api.show_works_with_collaboration(ror, start, end, self._check_stop)
-        except Exception as e :
-            messagebox.showerror("Erreur", str(e))
+    def show_top_partners(self):
+        years = self.__get_validated_years()
+        if not years:
             return
-        
-        print(f"✅ Analyse des collaborations {start}-{end} avec {ror} terminée")
+        self.__submit("partners", *years)
+    
+    def show_trends(self):
+        years = self.__get_validated_years()
+        if not years:
+            return
+        # Sans ROR collaborateur : évolution de toutes les publications de l'institution
+        self.__submit("trends", *years, self.ror_entry.get().strip() or None)
+    
+    def generate_all_reports(self):
+        ror = self.ror_entry.get().strip()
+        if not ror:
+            messagebox.showerror("Erreur", "ROR collaborateur requis")
+            return
+            
+        years = self.__get_validated_years()
+        if not years:
+            return
+            
+        self.__submit("all", *years, ror)
     
     def on_close(self):
-        sys.stdout = sys.__stdout__
+        self.scheduler.shutdown()
+        logging.getLogger("openalex").removeHandler(self.log_handler)
         self.root.destroy()
 
 if __name__ == "__main__":
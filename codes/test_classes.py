@@ -0,0 +1,771 @@
+import contextlib
+import csv
+import io
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from xml.etree import ElementTree
+
+import pandas as pd
+import pytest
+import requests
+from openpyxl import load_workbook
+from requests.structures import CaseInsensitiveDict
+
+from benchmark import SyntheticTransport, INSTITUTION_ROR, COLLABORATOR_ROR, synthetic_work
+import classes
+import cli
+from charts import BarChart, PROCESS_THRESHOLD, render, render_many
+from gui import JobScheduler
+from classes import MyApi, ApiError, OperationCancelled, WorkTable, Exporter, WorkDeduplicator, WorkParser, PublicationAggregator, CollaborationIndex, RecordingTransport, ReplayTransport, normalize_doi, normalize_title, short_ror
+
+
+def error_response(request, status):
+    """Réponse d'erreur OpenAlex (corps JSON) pour une requête préparée"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+    response.raw = io.BytesIO(b'{"error": "refused"}')
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class KeyRequiredTransport(SyntheticTransport):
+    """Corpus synthétique refusant (403) le filtre from_updated_date sans clé d'API, comme OpenAlex ; garde les URL reçues"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        if "from_updated_date" in request.url and "api_key" not in request.url:
+            return error_response(request, 403)
+        return super().send(request, **kwargs)
+
+
+def make_api(tmp_path, transport, cache=True, **kwargs):
+    kwargs.setdefault("max_retries", 0)
+    return MyApi(cache_path=str(tmp_path / "cache.sqlite") if cache else None, transport=transport,
+                 output_dir=str(tmp_path / "resultats"), institution_rors=(INSTITUTION_ROR,), **kwargs)
+
+
+def work_ids(works):
+    return sorted(work.id for work in works)
+
+
+def test_second_sync_without_api_key_reads_the_cache(tmp_path):
+    transport = KeyRequiredTransport(300, 2020, 2021)
+    api = make_api(tmp_path, transport)
+    first = work_ids(api.iter_works(2020, 2021))
+    requests_count = len(transport.urls)
+
+    second = work_ids(api.iter_works(2020, 2021))
+
+    assert first and second == first
+    assert len(transport.urls) == requests_count
+
+
+def test_stale_year_without_api_key_is_downloaded_again(tmp_path):
+    transport = KeyRequiredTransport(300, 2020, 2021)
+    api = make_api(tmp_path, transport, cache_max_age=0)
+    first = work_ids(api.iter_works(2020, 2021))
+    requests_count = len(transport.urls)
+
+    second = work_ids(api.iter_works(2020, 2021))
+
+    assert second == first
+    assert len(transport.urls) > requests_count
+    assert not any("from_updated_date" in url for url in transport.urls)
+
+
+def test_second_sync_with_api_key_is_incremental(tmp_path):
+    transport = KeyRequiredTransport(300, 2020, 2021)
+    api = make_api(tmp_path, transport, api_key="secret")
+    first = work_ids(api.iter_works(2020, 2021))
+
+    second = work_ids(api.iter_works(2020, 2021))
+
+    assert second == first
+    assert any("from_updated_date" in url for url in transport.urls)
+
+
+def test_incremental_sync_detaches_works_whose_year_changed(tmp_path):
+    transport = KeyRequiredTransport(300, 2019, 2020)
+    api = make_api(tmp_path, transport, api_key="secret")
+    list(api.iter_works(2019, 2020))
+    moved = transport.works[2019].pop(0)
+    moved["publication_year"] = 2020
+    transport.works[2020].append(moved)
+    transport.pages.clear()
+
+    assert moved["id"] in work_ids(api.iter_works(2020))
+    assert moved["id"] not in work_ids(api.iter_works(2019))
+
+
+def test_stale_year_with_api_key_is_downloaded_again(tmp_path):
+    transport = KeyRequiredTransport(300, 2020, 2020)
+    api = make_api(tmp_path, transport, api_key="secret", cache_max_age=0)
+    list(api.iter_works(2020))
+    removed = transport.works[2020].pop(0)
+    transport.pages.clear()
+
+    assert removed["id"] not in work_ids(api.iter_works(2020))
+    assert not any("from_updated_date" in url for url in transport.urls)
+
+
+def test_api_key_and_mailto_are_url_encoded(tmp_path):
+    transport = KeyRequiredTransport(10, 2020, 2020)
+    api = make_api(tmp_path, transport, cache=False, api_key="a&b=c", mailto="me+tag@x.org")
+    list(api.iter_works(2020))
+
+    query = parse_qs(urlsplit(transport.urls[0]).query)
+    assert query["mailto"] == ["me+tag@x.org"]
+    assert query["api_key"] == ["a&b=c"]
+    assert query["filter"][0].startswith("authorships.institutions.ror:")
+
+
+
+def test_recorded_responses_are_replayed_with_other_credentials(tmp_path, monkeypatch):
+    synthetic = KeyRequiredTransport(500, 2019, 2020)
+    # Le « réseau » de l'enregistrement est le corpus synthétique
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", lambda adapter, request, **kwargs: synthetic.send(request, **kwargs))
+    fixtures = str(tmp_path / "enregistrements")
+    recorder = make_api(tmp_path, RecordingTransport(fixtures), cache=False, api_key="secret", mailto="me@x.org")
+    recorded = work_ids(recorder.iter_works(2019, 2020))
+    monkeypatch.undo()
+    assert all("api_key=secret" in url and "mailto=" in url for url in synthetic.urls)
+
+    # La clé d'API et l'adresse courriel ne font pas partie du nom des enregistrements
+    for api_key, mailto in ((None, None), ("autre", "other@y.org")):
+        replay = make_api(tmp_path, ReplayTransport(fixtures), cache=False, api_key=api_key, mailto=mailto)
+        assert work_ids(replay.iter_works(2019, 2020)) == recorded
+
+    # Requête absente des enregistrements : erreur 404 plutôt qu'un résultat vide
+    with pytest.raises(ApiError) as error:
+        list(replay.iter_works(2021))
+    assert error.value.status == 404
+
+
+class FlakyTransport(KeyRequiredTransport):
+    """Corpus synthétique dont les premières réponses sont données : (statut, en-têtes), exception réseau, ou None pour
+    une réponse normale"""
+
+    def __init__(self, *args, failures=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = list(failures)
+
+    def send(self, request, **kwargs):
+        failure = self.failures.pop(0) if self.failures else None
+        if failure is None:
+            return super().send(request, **kwargs)
+        self.urls.append(request.url)
+        if isinstance(failure, Exception):
+            raise failure
+        status, headers = failure
+        response = error_response(request, status)
+        response.headers.update(headers)
+        return response
+
+
+def test_requests_are_retried_after_rate_limits_and_errors(tmp_path):
+    transport = FlakyTransport(600, 2020, 2020, failures=[
+        (429, {"Retry-After": "0"}), (503, {}), None, requests.ConnectionError("connexion réinitialisée"),
+    ])
+    api = make_api(tmp_path, transport, cache=False, max_retries=3, backoff_factor=0)
+
+    works = work_ids(api.iter_works(2020, dedupe=False))
+
+    assert works == sorted(work["id"] for work in transport.works[2020])
+    assert api.metrics.value("retries_total") == 3
+    assert [api.metrics.value("retries_total", reason=reason) for reason in ("429", "503", "network")] == [1, 1, 1]
+
+
+def test_exhausted_retries_raise_instead_of_truncating(tmp_path):
+    transport = FlakyTransport(600, 2020, 2020, failures=[None, (503, {}), (503, {}), (503, {})])
+    api = make_api(tmp_path, transport, cache=False, max_retries=2, backoff_factor=0)
+
+    with pytest.raises(ApiError) as error:
+        list(api.iter_works(2020))
+
+    assert error.value.status == 503
+    assert api.metrics.value("retries_total") == 2
+
+
+def test_cancel_interrupts_the_retry_delay(tmp_path):
+    transport = FlakyTransport(300, 2020, 2020, failures=[(429, {"Retry-After": "30"})])
+    api = make_api(tmp_path, transport, cache=False, max_retries=3)
+    cancelled = threading.Event()
+    threading.Timer(0.2, cancelled.set).start()
+    start = time.monotonic()
+
+    with pytest.raises(OperationCancelled):
+        list(api.iter_works(2020, check_interrupt=cancelled.is_set))
+
+    assert time.monotonic() - start < 5
+    assert len(transport.urls) == 1
+
+
+class SlowFirstYearTransport(SyntheticTransport):
+    """Corpus synthétique dont la première année répond le plus lentement"""
+
+    def send(self, request, **kwargs):
+        if "publication_year:2019" in request.url:
+            time.sleep(0.05)
+        return super().send(request, **kwargs)
+
+
+def test_iter_works_yields_years_in_order(tmp_path):
+    api = make_api(tmp_path, SlowFirstYearTransport(1200, 2019, 2021), cache=False)
+
+    first = [work.id for work in api.iter_works(2019, 2021)]
+    second = [work.id for work in api.iter_works(2019, 2021)]
+
+    years = [int(work_id.rsplit("W", 1)[-1][:4]) for work_id in first]
+    assert years == sorted(years)
+    assert second == first
+
+
+class RejectingTransport(KeyRequiredTransport):
+    """Corpus synthétique refusant les requêtes group_by (statut donné) et celles filtrées sur un ROR inconnu"""
+
+    def __init__(self, *args, group_by_status=400, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.group_by_status = group_by_status
+
+    def send(self, request, **kwargs):
+        if "unknownror" in request.url:
+            self.urls.append(request.url)
+            return error_response(request, 400)
+        if "group_by" in request.url:
+            self.urls.append(request.url)
+            return error_response(request, self.group_by_status)
+        return super().send(request, **kwargs)
+
+
+def test_aggregate_falls_back_when_group_by_is_rejected(tmp_path):
+    api = make_api(tmp_path, RejectingTransport(300, 2020, 2020), cache=False)
+
+    counts = api.aggregate("countries", 2020)
+
+    expected = Counter()
+    for work in api.iter_works(2020, dedupe=False):
+        expected.update(set(work.countries()))
+    assert counts == expected
+
+
+def test_aggregate_reports_an_invalid_ror(tmp_path):
+    api = make_api(tmp_path, RejectingTransport(300, 2020, 2020), cache=False)
+
+    with pytest.raises(ValueError, match="ROR INVALIDE"):
+        api.aggregate("topics", 2020, collaborator_ror="https://ror.org/unknownror")
+
+
+def test_aggregate_does_not_fall_back_on_server_errors(tmp_path):
+    transport = RejectingTransport(300, 2020, 2020, group_by_status=503)
+    api = make_api(tmp_path, transport, cache=False)
+
+    with pytest.raises(ApiError):
+        api.aggregate("countries", 2020)
+    assert all("group_by" in url for url in transport.urls)
+
+
+def test_collaborators_count_each_institution_by_default(tmp_path):
+    api = make_api(tmp_path, KeyRequiredTransport(300, 2020, 2020), cache=False)
+    api.show_collaborators(2020)
+
+    df = pd.read_excel(tmp_path / "resultats" / "pays_collaborateurs_ets.xlsx")
+    expected = Counter(institution.country_code for work in api.iter_works(2020) for institution in work.institutions())
+    assert dict(zip(df["Pays"], df["Nombre de publications"])) == expected
+
+
+@pytest.fixture(params=["xlsxwriter", "openpyxl"])
+def xlsx_engine(request, monkeypatch):
+    """Exporte avec chaque moteur xlsx : xlsxwriter s'il est installé, puis le repli openpyxl"""
+    if request.param == "xlsxwriter":
+        pytest.importorskip("xlsxwriter")
+    else:
+        monkeypatch.setattr(classes, "xlsxwriter", None)
+    return request.param
+
+
+def test_xlsx_export_round_trip(tmp_path, xlsx_engine):
+    df = pd.DataFrame({
+        "Titre": ["Première", "Deuxième", "Troisième"],
+        "Année": [2019, 2020, 2021],
+        "Lien vers l'article": ["https://doi.org/10.1/a", None, "https://doi.org/10.1/c"],
+    })
+    exporter = Exporter(str(tmp_path), ("xlsx", "csv"))
+
+    exporter.export(df, "publications", sheet_size=2)
+
+    sheets = pd.read_excel(tmp_path / "publications.xlsx", sheet_name=None)
+    assert list(sheets) == ["Sheet_1", "Sheet_2"]
+    pd.testing.assert_frame_equal(pd.concat(sheets.values(), ignore_index=True), df)
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "publications.csv", encoding="utf-8-sig"), df)
+
+
+def test_xlsx_export_keeps_strings_as_text(tmp_path, xlsx_engine):
+    df = pd.DataFrame({
+        "Titre": ["=Une équation dans le titre", "Deuxième"],
+        # Liste de partenaires plus longue que la limite des liens Excel (2079 caractères)
+        "Partenaires (ROR)": [", ".join(f"https://ror.org/0{i:08d}" for i in range(120)), "https://ror.org/a, https://ror.org/b"],
+    })
+
+    Exporter(str(tmp_path)).export(df, "publications")
+
+    pd.testing.assert_frame_equal(pd.read_excel(tmp_path / "publications.xlsx"), df)
+    sheet = load_workbook(tmp_path / "publications.xlsx")["Sheet1"]
+    assert all(cell.hyperlink is None and cell.data_type == "s" for row in sheet.iter_rows() for cell in row)
+
+
+def test_xlsx_export_without_rows_keeps_the_header(tmp_path, xlsx_engine):
+    Exporter(str(tmp_path)).export(pd.DataFrame(columns=["Pays", "Nombre de publications"]), "pays")
+
+    assert list(pd.read_excel(tmp_path / "pays.xlsx").columns) == ["Pays", "Nombre de publications"]
+
+
+def make_work(parser, id, title, year=2020, doi=None):
+    return parser.work({"id": id, "display_name": title, "publication_year": year, "doi": doi})
+
+
+def test_normalized_keys():
+    assert normalize_doi(" HTTPS://doi.org/10.1/ABC ") == "10.1/abc"
+    assert normalize_doi("doi:10.1/abc") == "10.1/abc"
+    assert normalize_title("Éthique de l'IA : un État des lieux !") == "ethique de l ia un etat des lieux"
+
+
+def test_deduplicator_merges_later_versions_into_the_first():
+    parser = WorkParser()
+    preprint = make_work(parser, "W1", "A Study of Deep Learning Models")
+    published = make_work(parser, "W2", "A study of deep-learning models.", doi="https://doi.org/10.1/X")
+    erratum_doi = make_work(parser, "W3", "Something else entirely here", doi="doi:10.1/x")
+    same_id = make_work(parser, "W1", "Other title")
+    next_year = make_work(parser, "W4", "A Study of Deep Learning Models", year=2021)
+    editorials = [make_work(parser, "W5", "Editorial"), make_work(parser, "W6", "Editorial")]
+    deduplicator = WorkDeduplicator()
+    publications = PublicationAggregator()
+
+    for work in [preprint, published, erratum_doi, same_id, next_year] + editorials:
+        if deduplicator.add(work):
+            publications.add(work)
+
+    assert [work.id for work in publications.works] == ["W1", "W4", "W5", "W6"]
+    assert deduplicator.duplicates == Counter({"title": 1, "doi": 1, "id": 1})
+    # Le DOI de la version publiée complète la prépublication, y compris dans les lignes de l'export
+    assert publications.rows[0]["Lien vers l'article"] == "https://doi.org/10.1/X"
+
+
+class OtherInstitutionTransport(SyntheticTransport):
+    """Corpus synthétique servant, pour une seconde institution, d'autres notices (identifiants différents) des mêmes
+    publications ; mesure le nombre maximal de requêtes simultanées"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01)
+            response = super().send(request, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        if "ror:0other" in request.url:
+            response.raw = io.BytesIO(response.raw.read().replace(b"openalex.org/W", b"openalex.org/X"))
+        return response
+
+
+def test_compare_institutions_counts_shared_works_once(tmp_path):
+    transport = OtherInstitutionTransport(900, 2019, 2021)
+    distinct = len(list(make_api(tmp_path, transport, cache=False).iter_works(2019, 2021)))
+    transport.max_in_flight = 0
+    api = make_api(tmp_path, transport, cache=False, max_workers=2)
+
+    api.compare_institutions(2019, 2021, [INSTITUTION_ROR, "https://ror.org/0other", "https://ror.org/0third"])
+
+    assert len(pd.read_excel(tmp_path / "resultats" / "comparaison_pays.xlsx")) > 0
+    # Trois extractions de 900 notices ; celles de 0other ne diffèrent que par leur identifiant
+    assert api.metrics.value("duplicates_total") == 3 * 900 - distinct
+    assert transport.max_in_flight <= 2
+
+
+class SlowTransport(KeyRequiredTransport):
+    """Corpus synthétique répondant avec un délai, pour agir pendant un téléchargement"""
+
+    def send(self, request, **kwargs):
+        time.sleep(0.02)
+        return super().send(request, **kwargs)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_scheduler_jobs_join_a_running_download(tmp_path):
+    reference = SlowTransport(3000, 2019, 2021)
+    list(make_api(tmp_path, reference, cache=False).iter_works(2019, 2021))
+    transport = SlowTransport(3000, 2019, 2021)
+    scheduler = JobScheduler(make_api(tmp_path, transport, cache=False), lambda kind, job, value: None, max_jobs=2)
+
+    first = scheduler.submit("works", 2019, 2021)
+    # Le premier groupe a démarré son téléchargement : la tâche suivante forme un second groupe
+    wait_for(lambda: transport.urls)
+    second = scheduler.submit("collaborators", 2019, 2021)
+    scheduler.executor.shutdown(wait=True)
+
+    assert (first.status, second.status) == ("Terminée", "Terminée")
+    assert len(transport.urls) == len(reference.urls)
+    assert (tmp_path / "resultats" / "2019-2021" / "pays_collaborateurs_ets.xlsx").exists()
+    # Tâches terminées : le planificateur ne les conserve pas
+    assert scheduler.groups == {}
+
+
+class ConcurrencyTransport(SlowTransport):
+    """Corpus synthétique lent relevant le nombre maximal de requêtes simultanées"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_scheduler_jobs_share_the_request_limit(tmp_path):
+    transport = ConcurrencyTransport(1000, 2019, 2022)
+    api = make_api(tmp_path, transport, cache=False, max_workers=2)
+    scheduler = JobScheduler(api, lambda kind, job, value: None, max_jobs=2)
+
+    jobs = [scheduler.submit("works", 2019, 2020), scheduler.submit("works", 2021, 2022)]
+    scheduler.executor.shutdown(wait=True)
+
+    assert [job.status for job in jobs] == ["Terminée", "Terminée"]
+    # Deux tâches de deux années chacune : jamais plus de max_workers requêtes en cours (taille du groupe de connexions)
+    assert transport.peak == 2
+
+
+@pytest.mark.parametrize("per_work", [False, True])
+def test_all_reports_on_the_synthetic_corpus(tmp_path, per_work):
+    api = make_api(tmp_path, SyntheticTransport(600, 2019, 2020), cache=False)
+
+    api.generate_all_reports("https://ror.org/02feahw73", 2019, 2020, per_work=per_work)
+
+    output = tmp_path / "resultats"
+    for name in ("publications.xlsx", "pays_collaborateurs_ets.xlsx", "top_countries.png", "rapport_collaborations.docx",
+                 "top_topics.png"):
+        assert (output / name).exists()
+
+
+def test_cli_batch_downloads_each_period_once(tmp_path, monkeypatch):
+    reference = KeyRequiredTransport(600, 2019, 2020)
+    list(make_api(tmp_path, reference, cache=False).iter_works(2019, 2020))
+    transport = KeyRequiredTransport(600, 2019, 2020)
+    # Rejeu remplacé par le corpus synthétique ; le journal configuré par la ligne de commande est retiré après le test
+    monkeypatch.setattr(cli, "ReplayTransport", lambda directory: transport)
+    log = logging.getLogger("openalex")
+    monkeypatch.setattr(log, "handlers", [])
+    monkeypatch.setattr(log, "level", log.level)
+    rors = ["https://ror.org/02feahw73", "https://ror.org/002synth"]
+
+    status = cli.main(["all", "--years", "2019-2020", "--replay", str(tmp_path / "enregistrements"),
+                       "--output-dir", str(tmp_path / "cli")] + [arg for ror in rors for arg in ("--ror", ror)])
+
+    assert status == 0
+    assert len(transport.urls) == len(reference.urls)
+    output = tmp_path / "cli" / "2019-2020"
+    for name in ("publications.xlsx", "pays_collaborateurs_ets.xlsx", "rapport_collaborations.docx",
+                 "top_topics_02feahw73.png", "top_topics_002synth.png"):
+        assert (output / name).exists()
+
+
+def test_render_many_returns_images_in_order():
+    bar_charts = [BarChart(Counter({f"Pays {i}": i + 1, "Autre": 1}), f"Graphique {i}", "Pays", "Nombre")
+                  for i in range(PROCESS_THRESHOLD)]
+
+    # Au moins PROCESS_THRESHOLD graphiques : rendus dans un groupe de processus
+    png = render_many(bar_charts, "png")
+    svg = render_many(bar_charts, "svg")
+
+    assert png == [render(chart, "png") for chart in bar_charts]
+    # Le SVG porte sa date de création et des identifiants d'éléments aléatoires
+    normalized = lambda image: re.sub(rb"<dc:date>.*?</dc:date>|\b[mp][0-9a-f]{10}\b", b"", image)
+    assert [normalized(image) for image in svg] == [normalized(render(chart, "svg")) for chart in bar_charts]
+
+
+def test_batch_charts_are_rendered_together(tmp_path, monkeypatch):
+    calls = []
+
+    def sequential_render_many(charts, format="png", dpi=100, max_workers=None):
+        calls.append(len(charts))
+        return render_many(charts, format, dpi, max_workers=1)
+    monkeypatch.setattr(classes, "render_many", sequential_render_many)
+    api = make_api(tmp_path, SyntheticTransport(600, 2019, 2020), cache=False)
+    rors = ["https://ror.org/02feahw73", "https://ror.org/002synth", "https://ror.org/003synth"]
+
+    api.run_reports(2019, 2020, [("topics", ror) for ror in rors] + [("trends", ror) for ror in rors])
+
+    # Un graphique des sujets et trois graphiques de tendances par collaborateur, en un seul rendu
+    assert calls == [3 + 3 * 3]
+    assert (tmp_path / "resultats" / "rapport_tendances_003synth.docx").exists()
+
+
+def test_synthetic_group_by_counts_every_record(tmp_path):
+    api = make_api(tmp_path, SyntheticTransport(600, 2019, 2020), cache=False)
+    # group_by compte chaque notice OpenAlex, autres versions d'une même publication comprises
+    table = WorkTable()
+    for work in api.iter_works(2019, 2020, dedupe=False):
+        table.add(work)
+
+    assert api.aggregate("countries", 2019, 2020) == table.country_counts(per_work=True)
+    assert api.aggregate("topics", 2019, 2020) == table.topic_counts()
+    assert api.aggregate("years", 2019, 2020) == table.year_counts()
+
+
+def test_reports_count_each_publication_once(tmp_path):
+    api = make_api(tmp_path, SyntheticTransport(2000, 2019, 2020), cache=False)
+    table = WorkTable()
+    for work in api.iter_works(2019, 2020):
+        table.add(work)
+    cnrs = "https://ror.org/02feahw73"
+
+    assert api.count_countries(2019, 2020) == table.country_counts()
+    assert api.count_countries(2019, 2020, per_work=True) == table.country_counts(per_work=True)
+    assert api.aggregate("countries", 2019, 2020) != table.country_counts(per_work=True)
+
+    # Mêmes décomptes au fil du téléchargement (opération seule) et sur la table (avec la liste des publications)
+    alone, together = api.with_output_dir(str(tmp_path / "seule")), api.with_output_dir(str(tmp_path / "ensemble"))
+    alone.run_reports(2019, 2020, [("collaborators", None), ("topics", cnrs)], per_work=True)
+    together.run_reports(2019, 2020, [("works", None), ("collaborators", None), ("topics", cnrs)], per_work=True)
+    api.show_works_with_collaboration(cnrs, 2019, 2020)
+
+    for output in ("seule", "ensemble"):
+        df = pd.read_excel(tmp_path / output / "pays_collaborateurs_ets.xlsx")
+        assert dict(zip(df["Pays"], df["Nombre de publications distinctes"])) == table.country_counts(per_work=True)
+    topics_chart = (tmp_path / "resultats" / "top_topics.png").read_bytes()
+    assert (tmp_path / "seule" / "top_topics.png").read_bytes() == topics_chart
+    assert (tmp_path / "ensemble" / "top_topics.png").read_bytes() == topics_chart
+
+
+ETS = ("https://ror.org/0020snb74", "CA")
+CNRS = ("https://ror.org/02feahw73", "FR")
+MIT = ("https://ror.org/042nb2s44", "US")
+
+
+def affiliated_work(parser, id, year, authorships, topics, doi=None):
+    """Publication dont chaque affiliation est une liste de (ROR, pays)"""
+    return parser.work({
+        "id": id, "display_name": f"Publication {id}", "publication_year": year, "doi": doi,
+        "authorships": [{"institutions": [{"id": f"I{ror[-4:]}", "ror": ror, "country_code": country}
+                                          for ror, country in institutions]}
+                        for institutions in authorships],
+        "topics": [{"display_name": topic} for topic in topics],
+    })
+
+
+@pytest.fixture
+def work_table():
+    parser = WorkParser()
+    table = WorkTable(institution_rors=(ETS[0],))
+    for work in [
+        affiliated_work(parser, "W1", 2020, [[ETS, CNRS], [CNRS, MIT]], ["AI", "Robotics"], doi="https://doi.org/10.1/w1"),
+        affiliated_work(parser, "W2", 2021, [[ETS], [ETS]], ["AI"]),
+        affiliated_work(parser, "W3", 2021, [[CNRS]], ["Energy"]),
+    ]:
+        table.add(work)
+    return table
+
+
+def test_work_table_country_counts(work_table):
+    assert work_table.country_counts() == Counter({"CA": 3, "FR": 3, "US": 1})
+    assert work_table.country_counts(per_work=True) == Counter({"CA": 2, "FR": 2, "US": 1})
+    assert work_table.country_counts(required_rors={ETS[0], CNRS[0]}) == Counter({"CA": 1, "FR": 2, "US": 1})
+
+
+def test_work_table_topic_year_and_pair_counts(work_table):
+    assert work_table.topic_counts() == Counter({"AI": 2, "Robotics": 1, "Energy": 1})
+    assert work_table.topic_counts(required_rors={ETS[0], CNRS[0]}) == Counter({"AI": 1, "Robotics": 1})
+    assert work_table.year_counts() == Counter({2020: 1, 2021: 2})
+    assert work_table.ror_pair_counts() == Counter({
+        tuple(sorted((ETS[0], CNRS[0]))): 1, tuple(sorted((ETS[0], MIT[0]))): 1, tuple(sorted((CNRS[0], MIT[0]))): 1,
+    })
+
+
+def test_work_table_publications_carry_derived_fields(work_table):
+    publications = work_table.publications()
+
+    assert list(publications.columns) == ["Titre", "Année", "Lien vers l'article", "Pays collaborateurs",
+                                          "Partenaires (ROR)", "Sujet principal"]
+    first = publications.iloc[0]
+    assert (first["Titre"], first["Année"], first["Lien vers l'article"]) == ("Publication W1", 2020, "https://doi.org/10.1/w1")
+    assert first["Pays collaborateurs"] == "CA, FR, US"
+    assert first["Partenaires (ROR)"] == f"{CNRS[0]}, {MIT[0]}"
+    assert first["Sujet principal"] == "AI"
+
+
+
+@pytest.fixture
+def collaboration_index():
+    parser = WorkParser()
+    index = CollaborationIndex(ETS[0])
+    for work in [
+        affiliated_work(parser, "W1", 2020, [[ETS, CNRS], [CNRS, MIT]], ["AI", "Robotics"]),
+        affiliated_work(parser, "W2", 2021, [[ETS], [ETS]], ["AI"]),
+        affiliated_work(parser, "W3", 2021, [[CNRS]], ["Energy"]),
+        affiliated_work(parser, "W4", 2021, [[ETS], [MIT]], ["Energy"]),
+    ]:
+        index.add(work)
+    return index
+
+
+def test_collaboration_index_top_partners_and_partner_stats(collaboration_index):
+    assert collaboration_index.top_partners(1) == [(MIT[0], MIT[0], "US", 2)]
+    assert collaboration_index.top_partners(5) == [(MIT[0], MIT[0], "US", 2), (CNRS[0], CNRS[0], "FR", 1)]
+
+    # URL complète ou ROR court
+    assert collaboration_index.partner(MIT[0] + "/") == collaboration_index.partner(short_ror(MIT[0]))
+    assert collaboration_index.partner_topics(short_ror(MIT[0])) == Counter({"AI": 1, "Robotics": 1, "Energy": 1})
+    assert collaboration_index.partner(MIT[0])["years"] == Counter({2020: 1, 2021: 1})
+    assert collaboration_index.partner(MIT[0])["countries"] == Counter({"CA": 2, "US": 2, "FR": 1})
+    # Publication sans l'institution de référence : arêtes conservées, aucune statistique de partenaire
+    assert collaboration_index.partner(CNRS[0])["count"] == 1
+    assert collaboration_index.partner("https://ror.org/00unknown") is None
+    assert collaboration_index.partner_topics("00unknown") == Counter()
+
+
+def test_collaboration_index_graph_exports(collaboration_index, tmp_path):
+    edges = {(ETS[0], CNRS[0]): 1, (ETS[0], MIT[0]): 2, (CNRS[0], MIT[0]): 1}
+
+    collaboration_index.write_edge_list(tmp_path / "aretes.csv")
+    with open(tmp_path / "aretes.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["source", "target", "weight"]
+    assert {(source, target): int(weight) for source, target, weight in rows[1:]} == edges
+
+    collaboration_index.write_graphml(tmp_path / "graphe.graphml")
+    ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    graph = ElementTree.parse(tmp_path / "graphe.graphml").getroot().find("g:graph", ns)
+    nodes = {node.get("id"): node.find("g:data[@key='country']", ns).text for node in graph.findall("g:node", ns)}
+    assert nodes == {ETS[0]: "CA", CNRS[0]: "FR", MIT[0]: "US"}
+    assert {(edge.get("source"), edge.get("target")): int(edge.find("g:data[@key='weight']", ns).text)
+            for edge in graph.findall("g:edge", ns)} == edges
+
+
+def test_collaboration_index_is_reused_only_for_the_same_sync_state(tmp_path):
+    api = make_api(tmp_path, SyntheticTransport(600, 2019, 2020))
+    chart = tmp_path / "resultats" / "top_topics.png"
+
+    api.build_collaboration_index(2019, 2020)
+    api.show_works_with_collaboration(COLLABORATOR_ROR, 2019, 2020)
+    assert api.metrics.value("cache_hits_total", kind="index") == 1
+    indexed = chart.read_bytes()
+
+    # Années à retélécharger : l'index ne correspond plus forcément aux publications servies
+    api.cache_max_age = 0
+    api.show_works_with_collaboration(COLLABORATOR_ROR, 2019, 2020)
+    assert api.metrics.value("cache_hits_total", kind="index") == 1
+    assert chart.read_bytes() == indexed
+
+    # Cache modifié depuis la construction de l'index : il est reconstruit
+    api.cache_max_age = 1
+    index = api.build_collaboration_index(2019, 2020)
+    api.cache.reset(f"{api.institution_ror}:2019")
+    assert api.build_collaboration_index(2019, 2020) is not index
+
+
+def test_collaboration_indexes_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(MyApi, "INDEX_CACHE_SIZE", 2)
+    api = make_api(tmp_path, SyntheticTransport(200, 2019, 2021))
+
+    first = api.build_collaboration_index(2019)
+    api.build_collaboration_index(2020)
+    assert api.build_collaboration_index(2019) is first
+    api.build_collaboration_index(2021)
+
+    # L'index le moins récemment utilisé (2020) est oublié
+    assert [key[1] for key in api.collaboration_indexes] == [2019, 2021]
+
+def test_cancelled_download_is_not_served_from_the_cache(tmp_path):
+    reference = work_ids(make_api(tmp_path, SyntheticTransport(3000, 2019, 2019), cache=False).iter_works(2019))
+    transport = SlowTransport(3000, 2019, 2019)
+    api = make_api(tmp_path, transport)
+    cancelled = threading.Event()
+
+    works = api.iter_works(2019, check_interrupt=cancelled.is_set)
+    next(works)
+    cancelled.set()
+    with contextlib.suppress(OperationCancelled):
+        list(works)
+
+    assert len(transport.urls) < 3000 // 200
+    # L'année interrompue n'est pas marquée synchronisée : elle est retéléchargée entièrement
+    assert work_ids(api.iter_works(2019)) == reference
+
+
+def test_cancelled_yearly_counts_are_not_stored(tmp_path):
+    transport = SlowTransport(3000, 2019, 2020)
+    api = make_api(tmp_path, transport)
+
+    with pytest.raises(OperationCancelled):
+        api.yearly_counts(2019, 2020, check_interrupt=lambda: len(transport.urls) >= 2)
+
+    assert api.cache.load_partition(api.institution_ror, None, 2019) is None
+    assert api.cache.load_partition(api.institution_ror, None, 2020) is None
+
+
+def test_yearly_counts_follow_the_sync_of_their_year(tmp_path):
+    transport = SyntheticTransport(400, 2019, 2020)
+    api = make_api(tmp_path, transport)
+    first = api.yearly_counts(2019, 2020)
+    assert api.yearly_counts(2019, 2020) == first
+    assert api.metrics.value("cache_hits_total", kind="partitions") == 2
+
+    # Nouvelle publication de 2019 dans OpenAlex : elle est prise en compte dès que l'année est à retélécharger
+    transport.works[2019].append(synthetic_work(len(transport.works[2019]), 2019))
+    transport.pages.clear()
+    api.cache_max_age = 0
+    counts = api.yearly_counts(2019, 2020)
+    assert api.metrics.value("cache_hits_total", kind="partitions") == 2
+    assert counts[2019]["publications"] == first[2019]["publications"] + 1
+    assert counts[2020] == first[2020]
+
+    # Décomptes calculés avant la dernière synchronisation de l'année : recalculés
+    api.cache_max_age = 1
+    api.cache.mark_synced(f"{api.institution_ror}:2020", "9999-12-31")
+    assert api.yearly_counts(2019, 2020) == counts
+    assert api.metrics.value("cache_hits_total", kind="partitions") == 3
+
+
+def test_cancelling_a_job_stops_its_download(tmp_path):
+    transport = SlowTransport(3000, 2019, 2021)
+    scheduler = JobScheduler(make_api(tmp_path, transport, cache=False), lambda kind, job, value: None)
+
+    job = scheduler.submit("works", 2019, 2021)
+    wait_for(lambda: transport.urls)
+    scheduler.cancel(job.id)
+    scheduler.executor.shutdown(wait=True)
+
+    assert job.status == "Annulée"
+    assert len(transport.urls) < 3 * 1000 // 200
+    assert not (tmp_path / "resultats" / "2019-2021" / "publications.xlsx").exists()